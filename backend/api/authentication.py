@@ -0,0 +1,114 @@
+import hashlib
+import time
+
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+AUTH_CACHE = 'auth'
+
+
+class TokenCache:
+    """
+    Кэш соответствия токена пользователю.
+
+    Рядом с записью (user, token) лежит версия токена. Версия читается
+    до запроса к базе и сохраняется в записи, а сброс увеличивает ее
+    после фиксации транзакции. Поэтому запись, построенная по данным
+    до выхода из системы или смены пароля, не совпадет по версии
+    и не будет использована, даже если запрос записал ее в кэш позже
+    сброса.
+
+    Кэш работает только с бэкендом, общим для всех процессов: сброс
+    в кэше одного процесса не виден остальным, и они принимали бы
+    отозванный токен до истечения AUTH_CACHE_TIMEOUT.
+    """
+
+    @property
+    def cache(self):
+        return caches[AUTH_CACHE]
+
+    @property
+    def enabled(self):
+        return not isinstance(self.cache, (DummyCache, LocMemCache))
+
+    @staticmethod
+    def entry_key(key):
+        return 'token:' + hashlib.sha256(key.encode()).hexdigest()
+
+    def get(self, key):
+        """
+        Возвращает (user, token) из кэша или None и текущую версию
+        токена для последующего set.
+        """
+        entry_key = self.entry_key(key)
+        version_key = f'{entry_key}:version'
+        values = self.cache.get_many((entry_key, version_key))
+        version = values.get(version_key)
+        if version is None:
+            self.cache.add(version_key, time.time_ns(), timeout=None)
+            return None, self.cache.get(version_key)
+        entry = values.get(entry_key)
+        if entry is None or entry[0] != version:
+            return None, version
+        return entry[1], version
+
+    def set(self, key, version, user_token):
+        if version is not None:
+            self.cache.set(self.entry_key(key), (version, user_token))
+
+    def invalidate(self, keys):
+        """Сбрасывает записи токенов после фиксации транзакции."""
+        if not self.enabled:
+            return
+        keys = list(keys)
+
+        def update():
+            for key in keys:
+                version_key = f'{self.entry_key(key)}:version'
+                try:
+                    self.cache.incr(version_key)
+                except ValueError:
+                    self.cache.set(version_key, time.time_ns(), timeout=None)
+        transaction.on_commit(update)
+
+    def invalidate_user(self, user_id):
+        """Сбрасывает записи всех токенов пользователя."""
+        if not self.enabled:
+            return
+        self.invalidate(
+            Token.objects.filter(user_id=user_id).values_list('key', flat=True)
+        )
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Аутентификация по токену с кэшем пользователя.
+
+    Неизвестные токены не кэшируются и каждый раз проверяются по базе.
+    Пользователь из кэша может отставать от базы на AUTH_CACHE_TIMEOUT,
+    поэтому request.user сохраняется только с явным update_fields.
+    С кэшем в памяти процесса работает как TokenAuthentication.
+    """
+
+    def authenticate_credentials(self, key):
+        if not token_cache.enabled:
+            return super().authenticate_credentials(key)
+        user_token, version = token_cache.get(key)
+        if user_token is None:
+            user_token = super().authenticate_credentials(key)
+            token_cache.set(key, version, user_token)
+            return user_token
+        if not user_token[0].is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.')
+            )
+        return user_token
@@ -0,0 +1,53 @@
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from rest_framework import status
+
+
+def link_batch(manager, queryset, ids, add, errors, forbidden=(),
+               not_found_status=status.HTTP_404_NOT_FOUND):
+    """
+    Добавляет (add=True) или убирает связи manager с объектами
+    queryset из списка ids: одна проверка существования и связей,
+    затем одна вставка в промежуточную таблицу с ignore_conflicts
+    или одно удаление. Сигналы m2m_changed отправляются, как при
+    одиночном запросе, поэтому счетчики и ленты остаются верными.
+
+    errors — тексты ошибок по ключам 'not_found', 'exists', 'missing'
+    и 'forbidden' (для id из forbidden), not_found_status — статус
+    для несуществующих id. Возвращает по записи на каждый id
+    со статусом, как у одиночного запроса.
+    """
+    results = []
+    changed = []
+    with transaction.atomic():
+        linked = dict(queryset.filter(pk__in=ids).annotate(
+            linked=Exists(manager.filter(pk=OuterRef('pk')))
+        ).values_list('pk', 'linked'))
+        for pk in ids:
+            if pk not in linked:
+                error = 'not_found'
+            elif add and pk in forbidden:
+                error = 'forbidden'
+            elif linked[pk] == add:
+                error = 'exists' if add else 'missing'
+            else:
+                changed.append(pk)
+                results.append({
+                    'id': pk,
+                    'status': (
+                        status.HTTP_201_CREATED if add
+                        else status.HTTP_204_NO_CONTENT
+                    )
+                })
+                continue
+            results.append({
+                'id': pk,
+                'status': (
+                    not_found_status if error == 'not_found'
+                    else status.HTTP_400_BAD_REQUEST
+                ),
+                'errors': errors[error]
+            })
+        if changed:
+            (manager.add if add else manager.remove)(*changed)
+    return results
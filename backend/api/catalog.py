@@ -0,0 +1,87 @@
+import time
+
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+from rest_framework.renderers import JSONRenderer
+
+from recipes import changes
+from recipes.models import Ingredient, Tag
+
+CATALOG_CACHE = 'catalog'
+
+
+class Catalog:
+    """
+    Версионированный кэш справочника.
+
+    Хранит сериализованный JSON списка и словарь записей по id.
+    Версия складывается из номера в том же кэше, который сбрасывается
+    сразу, и счетчика изменений change_key в базе. Счетчик общий
+    для всех процессов, поэтому изменение справочника в одном
+    процессе видно остальным и при кэше в памяти процесса.
+    """
+
+    def __init__(self, model, serializer_path, change_key):
+        self.model = model
+        self.serializer_path = serializer_path
+        self.change_key = change_key
+        self.label = model._meta.label_lower
+
+    @property
+    def cache(self):
+        return caches[CATALOG_CACHE]
+
+    @property
+    def version_key(self):
+        return f'{self.label}:version'
+
+    def version(self):
+        """Возвращает текущую версию справочника."""
+        version = self.cache.get(self.version_key)
+        if version is None:
+            self.cache.add(self.version_key, time.time_ns(), timeout=None)
+            version = self.cache.get(self.version_key)
+        (changed,), _ = changes.read((self.change_key,))
+        return f'{version}.{changed}'
+
+    def invalidate(self):
+        """Переводит справочник на новую версию."""
+        try:
+            self.cache.incr(self.version_key)
+        except ValueError:
+            self.cache.set(self.version_key, time.time_ns(), timeout=None)
+
+    def build(self):
+        """Сериализует справочник из базы данных."""
+        serializer_class = import_string(self.serializer_path)
+        data = serializer_class(self.model.objects.all(), many=True).data
+        return {
+            'content': JSONRenderer().render(data),
+            'items': {item['id']: dict(item) for item in data},
+        }
+
+    def load(self):
+        key = f'{self.label}:{self.version()}'
+        value = self.cache.get(key)
+        if value is None:
+            value = self.build()
+            self.cache.set(key, value)
+        return value
+
+    def content(self):
+        """Возвращает список записей в виде готовых байтов JSON."""
+        return self.load()['content']
+
+    def get(self, pk):
+        """Возвращает сериализованную запись по id или None."""
+        return self.load()['items'].get(pk)
+
+    def ids(self):
+        """Возвращает множество id записей справочника."""
+        return self.load()['items'].keys()
+
+
+tag_catalog = Catalog(Tag, 'api.serializers.TagSerializer', changes.TAGS)
+ingredient_catalog = Catalog(
+    Ingredient, 'api.serializers.IngredientSerializer', changes.INGREDIENTS
+)
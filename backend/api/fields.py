@@ -0,0 +1,102 @@
+import base64
+import binascii
+import string
+
+import filetype
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from drf_extra_fields.fields import Base64ImageField
+from rest_framework import serializers
+from rest_framework.fields import ImageField
+
+BASE64_CHUNK_SIZE = 4 * 64 * 1024
+
+BASE64_WHITESPACE = str.maketrans('', '', string.whitespace)
+
+
+def decode_base64(data, destination, chunk_size=BASE64_CHUNK_SIZE):
+    """
+    Декодирует base64-строку в файл частями, не создавая в памяти
+    копию раскодированных данных целиком.
+    """
+    tail = ''
+    for start in range(0, len(data), chunk_size):
+        chunk = tail + data[start:start + chunk_size].translate(
+            BASE64_WHITESPACE
+        )
+        cut = len(chunk) - len(chunk) % 4
+        destination.write(base64.b64decode(chunk[:cut], validate=True))
+        tail = chunk[cut:]
+    if tail:
+        raise binascii.Error('Incorrect padding')
+
+
+class StreamingBase64ImageField(Base64ImageField):
+    """
+    Поле изображения в base64, которое раскодирует данные частями
+    во временный файл. Хранилище затем перемещает этот файл
+    в MEDIA_ROOT без повторного копирования.
+    """
+
+    def to_internal_value(self, base64_data):
+        if base64_data in self.EMPTY_VALUES:
+            return None
+        if not isinstance(base64_data, str):
+            return super().to_internal_value(base64_data)
+        content_type = None
+        if ';base64,' in base64_data:
+            header, base64_data = base64_data.split(';base64,', 1)
+            if self.trust_provided_content_type:
+                content_type = header.replace('data:', '')
+        file_name = self.get_file_name(None)
+        uploaded = TemporaryUploadedFile(
+            file_name, content_type, 0, None
+        )
+        try:
+            decode_base64(base64_data, uploaded.file)
+        except (TypeError, binascii.Error, ValueError):
+            uploaded.close()
+            raise ValidationError(self.INVALID_FILE_MESSAGE)
+        uploaded.size = uploaded.file.tell()
+        uploaded.file.seek(0)
+        extension = filetype.guess_extension(uploaded.file.read(262))
+        uploaded.file.seek(0)
+        extension = 'jpg' if extension == 'jpeg' else extension
+        if extension not in self.ALLOWED_TYPES:
+            uploaded.close()
+            raise ValidationError(self.INVALID_TYPE_MESSAGE)
+        uploaded.name = f'{file_name}.{extension}'
+        return ImageField.to_internal_value(self, uploaded)
+
+
+class RecipeImageField(serializers.ImageField):
+    """
+    Ссылка на изображение рецепта нужного размера. Пока копии
+    не построены, отдается исходное изображение.
+
+    rendition используется для одиночного рецепта, list_rendition —
+    для рецепта в списке.
+    """
+
+    def __init__(self, rendition, list_rendition=None, **kwargs):
+        self.rendition = rendition
+        self.list_rendition = list_rendition or rendition
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        rendition = self.rendition
+        if isinstance(
+            getattr(self.parent, 'parent', None), serializers.ListSerializer
+        ):
+            rendition = self.list_rendition
+        image = recipe.image
+        renditions = recipe.image_renditions
+        if image and renditions.get('source') == image.name and (
+            rendition in renditions
+        ):
+            image = image.field.attr_class(
+                recipe, image.field, renditions[rendition]
+            )
+        return super().to_representation(image)
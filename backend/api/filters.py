@@ -1,21 +1,56 @@
 from django_filters import rest_framework as filters
-from django.db.models import Q
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, Q, When
+from django.db.models.expressions import RawSQL
 
+from recipes.consts import (
+    INGREDIENT_SEARCH_MAX_RESULTS, RECIPE_SEARCH_CONFIG,
+    RECIPE_SEARCH_MAX_RESULTS
+)
 from recipes.models import Ingredient, Recipe, Tag
+from recipes.search import ingredient_index, recipe_index
+
+
+def order_by_ids(queryset, ids):
+    """Оставляет записи с id из ids и сортирует их в том же порядке."""
+    if not ids:
+        return queryset.none()
+    return queryset.filter(pk__in=ids).order_by(
+        Case(
+            *(When(pk=pk, then=position)
+              for position, pk in enumerate(ids)),
+            default=len(ids)
+        )
+    )
 
 
 class IngredientFilter(filters.FilterSet):
     """Фильтр игредиентов."""
 
-    name = filters.CharFilter(
-        field_name='name',
-        lookup_expr='istartswith',
-    )
+    name = filters.CharFilter(method='filter_name')
 
     class Meta:
         model = Ingredient
         fields = ('name',)
 
+    def filter_name(self, queryset, name, value):
+        """
+        Ищет ингредиенты по началу названия, затем по вхождению,
+        и возвращает не больше INGREDIENT_SEARCH_MAX_RESULTS записей.
+        В PostgreSQL поиск опирается на триграммный индекс,
+        в остальных СУБД — на индекс в памяти процесса.
+        """
+        value = value.strip()
+        if not value:
+            return queryset.none()
+        if connection.vendor == 'postgresql':
+            return queryset.filter(name__icontains=value).order_by(
+                Case(When(name__istartswith=value, then=0), default=1),
+                'name'
+            )[:INGREDIENT_SEARCH_MAX_RESULTS]
+        return order_by_ids(queryset, ingredient_index.search(value))
+
 
 class RecipeFilter(filters.FilterSet):
     """Фильтр рецептов."""
@@ -29,27 +64,67 @@ class RecipeFilter(filters.FilterSet):
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart'
     )
+    search = filters.CharFilter(method='filter_search')
 
     class Meta:
         model = Recipe
-        fields = ('is_favorited', 'author', 'tags', 'is_in_shopping_cart')
+        fields = (
+            'is_favorited', 'author', 'tags', 'is_in_shopping_cart', 'search'
+        )
 
-    def filter_is_favorited(self, queryset, name, value):
+    def filter_membership(self, queryset, through, value):
+        """
+        Фильтрует рецепты по наличию связи с текущим
+        пользователем в промежуточной таблице.
+        """
         if not self.request.user.id:
             return queryset
-        condition_is_favorited = Q(
-            favorite_recipes__id__icontains=self.request.user.id
+        condition = Q(
+            pk__in=through.objects.filter(
+                user=self.request.user
+            ).values('recipe_id')
         )
         if value:
-            return queryset.filter(condition_is_favorited)
-        return queryset.exclude(condition_is_favorited)
+            return queryset.filter(condition)
+        return queryset.exclude(condition)
+
+    def filter_is_favorited(self, queryset, name, value):
+        return self.filter_membership(
+            queryset, Recipe.favorite_recipes.through, value
+        )
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
-        if not self.request.user.id:
-            return queryset
-        condition_is_in_shopping_cart = Q(
-            shopping_cart_recipes__id__icontains=self.request.user.id
+        return self.filter_membership(
+            queryset, Recipe.shopping_cart_recipes.through, value
+        )
+
+    def filter_search(self, queryset, name, value):
+        """
+        Полнотекстовый поиск по названию, ингредиентам и тексту рецепта
+        с сортировкой по релевантности. При RECIPE_SEARCH_BACKEND =
+        'postgres' в PostgreSQL поиск идет по GIN-индексу столбца
+        search_vector, иначе — по инвертированному индексу в памяти
+        процесса, который возвращает не больше RECIPE_SEARCH_MAX_RESULTS
+        лучших рецептов.
+        """
+        if (
+            settings.RECIPE_SEARCH_BACKEND == 'postgres'
+            and connection.vendor == 'postgresql'
+        ):
+            from django.contrib.postgres.search import (
+                SearchQuery, SearchRank, SearchVectorField
+            )
+
+            query = SearchQuery(
+                value, config=RECIPE_SEARCH_CONFIG, search_type='websearch'
+            )
+            vector = RawSQL(
+                f'{Recipe._meta.db_table}.search_vector', (),
+                output_field=SearchVectorField()
+            )
+            return queryset.annotate(search_vector=vector).filter(
+                search_vector=query
+            ).order_by(SearchRank(vector, query).desc(), '-pub_date', '-id')
+        return order_by_ids(
+            queryset, recipe_index.search(value, RECIPE_SEARCH_MAX_RESULTS)
         )
-        if value:
-            return queryset.filter(condition_is_in_shopping_cart)
-        return queryset.exclude(condition_is_in_shopping_cart)
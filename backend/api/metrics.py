@@ -0,0 +1,211 @@
+import random
+import time
+from bisect import bisect_left
+from collections import Counter
+from threading import Lock
+
+from django.conf import settings
+
+from recipes.models import RuntimeSetting
+
+LATENCY_BUCKETS = tuple(
+    mantissa * 2 ** exponent
+    for exponent in range(-13, 6)
+    for mantissa in (1, 1.25, 1.5, 1.75)
+)
+
+SAMPLE_RATE_KEY = 'metrics:sample_rate'
+
+SAMPLE_RATE_TTL = 5
+
+
+class Histogram:
+    """
+    Гистограмма с логарифмически-линейными границами, как в HDR
+    Histogram: четыре корзины на каждую степень двойки, то есть
+    относительная погрешность не больше 25% на всем диапазоне
+    от 0,1 мс до минуты.
+    """
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        """Перебирает пары (граница, число значений не больше нее)."""
+        total = 0
+        for bound, count in zip(self.bounds, self.counts):
+            total += count
+            yield bound, total
+        yield float('inf'), self.count
+
+
+class QueryRecorder:
+    """
+    Обертка выполнения SQL для connection.execute_wrapper:
+    считает запросы, их суммарное время и повторы одного и того же
+    запроса с теми же параметрами.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.statements[sql, repr(params)] += 1
+
+    @property
+    def duplicates(self):
+        return sum(
+            count - 1 for count in self.statements.values() if count > 1
+        )
+
+
+class EndpointStats:
+
+    def __init__(self):
+        self.requests = 0
+        self.queries = 0
+        self.duplicates = 0
+        self.wall = Histogram()
+        self.db = Histogram()
+
+
+class MetricsRegistry:
+    """Метрики запросов к API в памяти процесса по действиям вьюсетов."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._endpoints = {}
+        self._sample_rate = None
+        self._sample_rate_read_at = 0
+
+    def observe(self, endpoint, wall, db, queries, duplicates):
+        with self._lock:
+            stats = self._endpoints.get(endpoint)
+            if stats is None:
+                stats = self._endpoints[endpoint] = EndpointStats()
+            stats.requests += 1
+            stats.queries += queries
+            stats.duplicates += duplicates
+            stats.wall.observe(wall)
+            stats.db.observe(db)
+
+    def sample_rate(self):
+        """
+        Доля запросов, для которых снимаются метрики. Значение,
+        заданное во время работы, хранится в базе и перечитывается
+        не чаще раза в SAMPLE_RATE_TTL секунд.
+        """
+        now = time.monotonic()
+        if (
+            self._sample_rate is None
+            or now - self._sample_rate_read_at > SAMPLE_RATE_TTL
+        ):
+            rate = RuntimeSetting.objects.filter(
+                key=SAMPLE_RATE_KEY
+            ).values_list('value', flat=True).first()
+            self._sample_rate = (
+                rate if rate is not None else settings.METRICS_SAMPLE_RATE
+            )
+            self._sample_rate_read_at = now
+        return self._sample_rate
+
+    def set_sample_rate(self, rate):
+        RuntimeSetting.objects.update_or_create(
+            key=SAMPLE_RATE_KEY, defaults={'value': rate}
+        )
+        self._sample_rate = rate
+        self._sample_rate_read_at = time.monotonic()
+
+    def sampled(self):
+        rate = self.sample_rate()
+        return rate >= 1 or random.random() < rate
+
+    def render(self):
+        """Возвращает метрики в текстовом формате Prometheus."""
+        with self._lock:
+            endpoints = sorted(self._endpoints.items())
+            lines = []
+            for name, attribute, help_text in (
+                ('foodgram_request_duration_seconds', 'wall',
+                 'Время обработки запроса'),
+                ('foodgram_db_duration_seconds', 'db',
+                 'Время выполнения SQL-запросов за запрос'),
+            ):
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} histogram')
+                for endpoint, stats in endpoints:
+                    histogram = getattr(stats, attribute)
+                    for bound, total in histogram.cumulative():
+                        lines.append(
+                            f'{name}_bucket{{endpoint="{endpoint}",'
+                            f'le="{format_bound(bound)}"}} {total}'
+                        )
+                    lines.append(
+                        f'{name}_sum{{endpoint="{endpoint}"}} '
+                        f'{histogram.sum}'
+                    )
+                    lines.append(
+                        f'{name}_count{{endpoint="{endpoint}"}} '
+                        f'{histogram.count}'
+                    )
+            for name, attribute, help_text in (
+                ('foodgram_requests_total', 'requests',
+                 'Число измеренных запросов'),
+                ('foodgram_db_queries_total', 'queries',
+                 'Число SQL-запросов'),
+                ('foodgram_db_duplicate_queries_total', 'duplicates',
+                 'Число повторов SQL-запроса с теми же параметрами'),
+            ):
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} counter')
+                for endpoint, stats in endpoints:
+                    lines.append(
+                        f'{name}{{endpoint="{endpoint}"}} '
+                        f'{getattr(stats, attribute)}'
+                    )
+        lines.append('# HELP foodgram_metrics_sample_rate '
+                     'Доля запросов, для которых снимаются метрики')
+        lines.append('# TYPE foodgram_metrics_sample_rate gauge')
+        lines.append(f'foodgram_metrics_sample_rate {self.sample_rate()}')
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+
+
+def render_cache_stats(name, stats):
+    """Возвращает счетчики кэша по слоям в текстовом формате Prometheus."""
+    lines = []
+    for metric, key, metric_type in (
+        ('hits_total', 'hits', 'counter'),
+        ('misses_total', 'misses', 'counter'),
+        ('entries', 'entries', 'gauge'),
+    ):
+        lines.append(f'# TYPE {name}_{metric} {metric_type}')
+        for layer, values in stats.items():
+            lines.append(f'{name}_{metric}{{layer="{layer}"}} {values[key]}')
+    return '\n'.join(lines) + '\n'
+
+
+def format_bound(bound):
+    return '+Inf' if bound == float('inf') else repr(bound)
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,106 @@
+import time
+
+from django.conf import settings
+from django.db import connection
+
+from api.metrics import QueryRecorder, metrics
+from api.nplusone import NPlusOneDetector
+
+API_PREFIX = '/api/'
+
+
+class MetricsMiddleware:
+    """
+    Снимает для запросов к API время обработки, время и число
+    SQL-запросов и число повторов одного запроса. Метрики копятся
+    по действиям вьюсетов (RecipeViewSet.list и т. п.). У потоковых
+    ответов учитываются и запросы, выполненные при отдаче тела.
+    Сотрудникам и при DEBUG метрики дублируются в заголовок
+    Server-Timing.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not request.path.startswith(API_PREFIX) or not metrics.sampled():
+            return self.get_response(request)
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        if response.streaming:
+            response.streaming_content = self.record_stream(
+                response.streaming_content, request, started, recorder
+            )
+            return response
+        wall = self.observe(request, started, recorder)
+        if settings.DEBUG or getattr(
+            getattr(request, 'user', None), 'is_staff', False
+        ):
+            response['Server-Timing'] = (
+                f'app;dur={wall * 1000:.2f}, '
+                f'db;dur={recorder.duration * 1000:.2f};'
+                f'desc="{recorder.count} queries, '
+                f'{recorder.duplicates} duplicates"'
+            )
+        return response
+
+    @staticmethod
+    def observe(request, started, recorder):
+        wall = time.perf_counter() - started
+        metrics.observe(
+            getattr(request, 'metrics_endpoint', 'unresolved'),
+            wall,
+            recorder.duration,
+            recorder.count,
+            recorder.duplicates
+        )
+        return wall
+
+    def record_stream(self, content, request, started, recorder):
+        """
+        Отдает тело потокового ответа, записывая SQL-запросы,
+        выполненные при построении каждой части, и снимает метрики
+        после отдачи всего тела.
+        """
+        iterator = iter(content)
+        try:
+            while True:
+                with connection.execute_wrapper(recorder):
+                    try:
+                        chunk = next(iterator)
+                    except StopIteration:
+                        return
+                yield chunk
+        finally:
+            self.observe(request, started, recorder)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'cls', None)
+        if view_class is None:
+            request.metrics_endpoint = view_func.__name__
+            return None
+        actions = getattr(view_func, 'actions', None) or {}
+        action = actions.get(request.method.lower(), request.method.lower())
+        request.metrics_endpoint = f'{view_class.__name__}.{action}'
+        return None
+
+
+class NPlusOneMiddleware:
+    """
+    Ищет N+1 среди SQL-запросов одного запроса к API.
+    Отключается при NPLUSONE_THRESHOLD = 0.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if (
+            not settings.NPLUSONE_THRESHOLD
+            or not request.path.startswith(API_PREFIX)
+        ):
+            return self.get_response(request)
+        with NPlusOneDetector():
+            return self.get_response(request)
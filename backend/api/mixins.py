@@ -1,4 +1,15 @@
+import hashlib
+from collections import OrderedDict
+
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
 from rest_framework import generics, status
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+
+from recipes import changes
 
 
 class UserAuthMixin(generics.CreateAPIView):
@@ -8,3 +19,166 @@ class UserAuthMixin(generics.CreateAPIView):
         response = super().post(request, *args, **kwargs)
         response.status_code = status.HTTP_200_OK
         return response
+
+
+class CatalogMixin:
+    """Миксин отдачи справочника из кэша."""
+
+    catalog = None
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params:
+            return super().list(request, *args, **kwargs)
+        return HttpResponse(
+            self.catalog.content(),
+            content_type='application/json'
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            item = self.catalog.get(int(kwargs[self.lookup_field]))
+        except ValueError:
+            item = None
+        if item is None:
+            raise NotFound
+        return Response(item)
+
+
+class KeysetPaginationMixin:
+    """
+    Миксин, включающий пагинацию по курсору,
+    если в запросе передан параметр cursor.
+    """
+
+    keyset_pagination_class = None
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            pagination_class = self.pagination_class
+            if (
+                self.keyset_pagination_class is not None
+                and self.keyset_pagination_class.cursor_query_param
+                in self.request.query_params
+            ):
+                pagination_class = self.keyset_pagination_class
+            self._paginator = (
+                pagination_class() if pagination_class else None
+            )
+        return self._paginator
+
+
+class ChangeKeysMixin:
+    """Миксин чтения счетчиков изменений данных, отдаваемых вьюсетом."""
+
+    change_keys = ()
+    user_dependent = False
+
+    def get_change_keys(self, request):
+        keys = list(self.change_keys)
+        if self.user_dependent and request.user.is_authenticated:
+            keys.append(changes.user_key(request.user.pk))
+        return keys
+
+    def read_changes(self, request):
+        """Читает счетчики один раз за запрос."""
+        if not hasattr(self, '_changes'):
+            self._changes = changes.read(self.get_change_keys(request))
+        return self._changes
+
+
+class ConditionalGetMixin(ChangeKeysMixin):
+    """
+    Миксин условных GET-запросов. ETag и Last-Modified строятся
+    по счетчикам изменений, поэтому ответ 304 отдается без обращения
+    к данным и сериализации.
+    """
+
+    def conditional(self, handler, request, *args, **kwargs):
+        versions, modified = self.read_changes(request)
+        etag = quote_etag(hashlib.sha256(
+            f'{request.get_full_path()}|{request.accepted_renderer.format}|'
+            f'{request.user.pk if self.user_dependent else ""}|{versions}'
+            .encode()
+        ).hexdigest()[:32])
+        last_modified = int(modified.timestamp()) if modified else None
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+        patch_vary_headers(response, ('Accept', 'Authorization'))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional(super().retrieve, request, *args, **kwargs)
+
+
+class ResponseCacheMixin(ChangeKeysMixin):
+    """
+    Миксин кэширования списка в общем слое с наложением
+    пользовательских флагов из response_cache.
+    """
+
+    response_cache = None
+    private_query_params = ()
+    shared_response = False
+
+    def get_response_user(self):
+        """Пользователь, для которого строятся данные ответа."""
+        if self.shared_response:
+            return AnonymousUser()
+        return self.request.user
+
+    def list(self, request, *args, **kwargs):
+        user = request.user
+        if user.is_authenticated and any(
+            param in request.query_params
+            for param in self.private_query_params
+        ):
+            return super().list(request, *args, **kwargs)
+        versions, _ = self.read_changes(request)
+        shared_count = len(self.change_keys)
+        key = (
+            request.build_absolute_uri(),
+            request.accepted_renderer.format,
+            tuple(versions[:shared_count])
+        )
+        data = self.response_cache.shared.get(key)
+        cache_status = 'HIT'
+        if data is None:
+            cache_status = 'MISS'
+            self.shared_response = True
+            try:
+                response = super().list(request, *args, **kwargs)
+            finally:
+                self.shared_response = False
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            data = response.data
+            if isinstance(data, dict):
+                data = OrderedDict(data, results=list(data['results']))
+            else:
+                data = list(data)
+            self.response_cache.shared.set(key, data)
+        if user.is_authenticated:
+            paginated = isinstance(data, dict)
+            results = data['results'] if paginated else data
+            overlay = self.response_cache.get_overlay(
+                (user.pk, tuple(versions[shared_count:]), key), user, results
+            )
+            results = self.response_cache.apply_overlay(results, overlay)
+            if paginated:
+                data = {**data, 'results': results}
+            else:
+                data = results
+        response = Response(data)
+        response['X-Cache'] = cache_status
+        return response
@@ -0,0 +1,144 @@
+import logging
+import os
+import re
+import sys
+from collections import Counter, namedtuple
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from rest_framework import serializers
+
+logger = logging.getLogger(__name__)
+
+SQL_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+SQL_PLACEHOLDER_LIST = re.compile(r'\(\s*%s(?:\s*,\s*%s)*\s*\)')
+SQL_WHITESPACE = re.compile(r'\s+')
+
+STACK_DEPTH = 5
+
+DEFAULT_THRESHOLD = 5
+
+IGNORED_MODULES = ('api.metrics', 'api.middleware', 'api.nplusone')
+
+Violation = namedtuple('Violation', ('sql', 'count', 'location', 'field'))
+
+
+class NPlusOneError(Exception):
+    """Найден повтор однотипных SQL-запросов из одного места кода."""
+
+
+def normalize_sql(sql):
+    """
+    Приводит SQL к форме запроса: литералы и списки параметров
+    любой длины заменяются заполнителями.
+    """
+    sql = SQL_LITERAL.sub('?', sql)
+    sql = SQL_PLACEHOLDER_LIST.sub('(%s, ...)', sql)
+    return SQL_WHITESPACE.sub(' ', sql).strip()
+
+
+class NPlusOneDetector:
+    """
+    Контекстный менеджер, ищущий N+1 среди SQL-запросов внутри блока.
+
+    Запросы группируются по нормализованному SQL и стеку вызовов
+    в коде проекта. Группа, в которой больше threshold запросов,
+    считается N+1. Для нее запоминается поле сериализатора, при
+    выводе которого выполнялся запрос. При выходе из блока
+    при NPLUSONE_RAISE (включается тестовым запуском) выбрасывается
+    NPlusOneError, иначе пишется предупреждение в журнал.
+    Разбор стека на каждом запросе недешев, поэтому вне DEBUG
+    проверка по умолчанию выключена.
+    """
+
+    def __init__(self, threshold=None, raise_errors=None):
+        self.threshold = (
+            settings.NPLUSONE_THRESHOLD if threshold is None else threshold
+        )
+        self.raise_errors = (
+            settings.NPLUSONE_RAISE if raise_errors is None
+            else raise_errors
+        )
+        self.counts = Counter()
+        self.fields = {}
+        self.violations = []
+        self._stack = None
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stack.close()
+        self.violations = [
+            Violation(sql, count, location, self.fields[sql, location])
+            for (sql, location), count in self.counts.items()
+            if count > self.threshold
+        ]
+        if exc_type is not None or not self.violations:
+            return False
+        if self.raise_errors:
+            raise NPlusOneError('\n'.join(
+                self.describe(violation) for violation in self.violations
+            ))
+        for violation in self.violations:
+            logger.warning(
+                'N+1: %s', self.describe(violation),
+                extra={'n_plus_one': violation._asdict()}
+            )
+        return False
+
+    def __call__(self, execute, sql, params, many, context):
+        location, field = self.inspect_stack(sys._getframe(1))
+        key = (normalize_sql(sql), location)
+        self.counts[key] += 1
+        self.fields.setdefault(key, field)
+        return execute(sql, params, many, context)
+
+    @staticmethod
+    def describe(violation):
+        return (
+            f'{violation.count} запросов из '
+            f'{violation.field or "кода вне сериализатора"} '
+            f'({" <- ".join(violation.location)}): {violation.sql}'
+        )
+
+    @staticmethod
+    def inspect_stack(frame):
+        """
+        Возвращает ближайшие вызовы из кода проекта и поле
+        сериализатора, которое выводилось в момент запроса.
+        """
+        location = []
+        field = None
+        while frame is not None:
+            code = frame.f_code
+            if field is None and code.co_name == 'to_representation':
+                serializer = frame.f_locals.get('self')
+                current = frame.f_locals.get('field')
+                if isinstance(serializer, serializers.Serializer) and (
+                    current is not None
+                ):
+                    field = (
+                        f'{type(serializer).__name__}.{current.field_name}'
+                    )
+            if len(location) < STACK_DEPTH and is_project_file(
+                code.co_filename
+            ) and frame.f_globals.get('__name__') not in IGNORED_MODULES:
+                location.append(
+                    f'{os.path.relpath(code.co_filename, settings.BASE_DIR)}'
+                    f':{frame.f_lineno} {code.co_name}'
+                )
+            if field is not None and len(location) >= STACK_DEPTH:
+                break
+            frame = frame.f_back
+        return tuple(location), field
+
+
+def is_project_file(filename):
+    return filename.startswith(str(settings.BASE_DIR)) and (
+        'site-packages' not in filename
+    )
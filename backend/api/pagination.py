@@ -1,4 +1,75 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from base64 import b64decode, b64encode
+from binascii import Error as Base64Error
+from collections import OrderedDict
+from urllib import parse
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import ParseError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Пагинатор, который не считает COUNT(*) точно, если записей
+    больше порога: в PostgreSQL число берется из оценки планировщика.
+    """
+
+    threshold = None
+    count_estimated = False
+
+    @cached_property
+    def count(self):
+        if not self.threshold or isinstance(self.object_list, list):
+            return super().count
+        bounded = self.object_list[:self.threshold + 1].count()
+        if bounded <= self.threshold:
+            return bounded
+        estimate = self.estimate()
+        if estimate is None:
+            return super().count
+        self.count_estimated = True
+        return max(estimate, bounded)
+
+    def estimate(self):
+        """Возвращает оценку числа строк планировщиком PostgreSQL."""
+        connection = connections[self.object_list.db]
+        if connection.vendor != 'postgresql':
+            return None
+        sql, params = self.object_list.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+    def validate_number(self, number):
+        if not (self.count and self.count_estimated):
+            return super().validate_number(number)
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('Номер страницы должен быть целым числом.')
+        if number < 1:
+            raise EmptyPage('Номер страницы меньше 1.')
+        return number
+
+    def page(self, number):
+        if not self.count_estimated:
+            return super().page(number)
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        return self._get_page(
+            self.object_list[bottom:bottom + self.per_page], number, self
+        )
 
 
 class GeneralPagination(PageNumberPagination):
@@ -7,3 +78,202 @@ class GeneralPagination(PageNumberPagination):
     page_size = 10
     page_size_query_param = 'limit'
     page_query_param = 'page'
+
+    def django_paginator_class(self, *args, **kwargs):
+        paginator = EstimatedCountPaginator(*args, **kwargs)
+        paginator.threshold = settings.PAGINATION_COUNT_ESTIMATE_THRESHOLD
+        return paginator
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        if self.page.paginator.count_estimated:
+            response.data['count_estimated'] = True
+        return response
+
+
+class KeysetPagination(BasePagination):
+    """
+    Пагинатор по ключу сортировки для бесконечной прокрутки.
+
+    Курсор хранит значения полей ordering последней записи страницы,
+    поэтому глубина прокрутки не влияет на стоимость запроса
+    и COUNT(*) не выполняется.
+    """
+
+    ordering = None
+    page_size = GeneralPagination.page_size
+    page_size_query_param = GeneralPagination.page_size_query_param
+    cursor_query_param = 'cursor'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return page_size if page_size > 0 else self.page_size
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            tokens = parse.parse_qs(
+                b64decode(encoded.encode('ascii')).decode('utf-8'),
+                keep_blank_values=True
+            )
+            position = [
+                model._meta.get_field(field.lstrip('-')).to_python(
+                    tokens[field.lstrip('-')][0]
+                )
+                for field in self.ordering
+            ]
+            reverse = tokens.get('r', ['0'])[0] == '1'
+        except (
+            Base64Error, KeyError, UnicodeError, ValidationError, ValueError
+        ):
+            raise ParseError('Некорректный курсор.')
+        return position, reverse
+
+    def encode_cursor(self, item, reverse):
+        tokens = {
+            field.lstrip('-'): getattr(item, field.lstrip('-'))
+            for field in self.ordering
+        }
+        tokens = {
+            key: value.isoformat() if hasattr(value, 'isoformat') else value
+            for key, value in tokens.items()
+        }
+        if reverse:
+            tokens['r'] = 1
+        encoded = b64encode(parse.urlencode(tokens).encode('utf-8'))
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, encoded.decode('ascii')
+        )
+
+    @staticmethod
+    def reverse_ordering(ordering):
+        return [
+            field[1:] if field.startswith('-') else f'-{field}'
+            for field in ordering
+        ]
+
+    def position_filter(self, position, reverse, ordering=None):
+        """Условие «запись идет после position» в порядке ordering."""
+        condition = None
+        for field, value in reversed(
+            list(zip(ordering or self.ordering, position))
+        ):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') != reverse else 'gt'
+            beyond = Q(**{f'{name}__{lookup}': value})
+            if condition is None:
+                condition = beyond
+            else:
+                condition = beyond | (Q(**{name: value}) & condition)
+        return condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = remove_query_param(
+            request.build_absolute_uri(), self.cursor_query_param
+        )
+        page_size = self.get_page_size(request)
+        position, reverse = self.decode_cursor(request, queryset.model)
+        ordering = self.ordering
+        if reverse:
+            ordering = self.reverse_ordering(ordering)
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(
+                self.position_filter(position, reverse)
+            )
+        results = list(queryset[:page_size + 1])
+        has_more = len(results) > page_size
+        results = results[:page_size]
+        if reverse:
+            results.reverse()
+        self.has_next = has_more if not reverse else position is not None
+        self.has_previous = (
+            has_more if reverse else position is not None
+        ) and bool(results)
+        self.page = results
+        return results
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+
+class RecipeKeysetPagination(KeysetPagination):
+    """Пагинатор рецептов по дате публикации."""
+
+    ordering = ('-pub_date', '-id')
+
+
+class SubscriptionKeysetPagination(KeysetPagination):
+    """Пагинатор подписок по имени пользователя."""
+
+    ordering = ('username', 'id')
+
+
+class FeedKeysetPagination(KeysetPagination):
+    """
+    Пагинатор ленты подписок. Страница собирается слиянием
+    нескольких источников, упорядоченных по дате публикации
+    и id рецепта: от каждого берется не больше страницы записей
+    после курсора.
+    """
+
+    ordering = ('-pub_date', '-id')
+
+    def paginate_sources(self, sources, queryset, request):
+        """
+        sources — пары (набор запросов, поля даты публикации и id
+        рецепта в нем); queryset — рецепты для заполнения страницы.
+        """
+        self.request = request
+        self.base_url = remove_query_param(
+            request.build_absolute_uri(), self.cursor_query_param
+        )
+        page_size = self.get_page_size(request)
+        position, reverse = self.decode_cursor(request, queryset.model)
+        keys = set()
+        for source, fields in sources:
+            ordering = [f'-{field}' for field in fields]
+            if position is not None:
+                source = source.filter(
+                    self.position_filter(position, reverse, ordering)
+                )
+            if reverse:
+                ordering = self.reverse_ordering(ordering)
+            keys.update(
+                source.order_by(*ordering).values_list(*fields)[
+                    :page_size + 1
+                ]
+            )
+        keys = sorted(keys, reverse=not reverse)
+        has_more = len(keys) > page_size
+        keys = keys[:page_size]
+        if reverse:
+            keys.reverse()
+        recipes = queryset.in_bulk([pk for _, pk in keys])
+        results = [recipes[pk] for _, pk in keys if pk in recipes]
+        self.has_next = has_more if not reverse else position is not None
+        self.has_previous = (
+            has_more if reverse else position is not None
+        ) and bool(results)
+        self.page = results
+        return results
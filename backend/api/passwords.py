@@ -0,0 +1,106 @@
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from threading import BoundedSemaphore, Lock
+
+import django
+from django.conf import settings
+from django.contrib.auth import hashers
+from rest_framework.exceptions import Throttled
+
+logger = logging.getLogger(__name__)
+
+HASHING_BUSY_RETRY_AFTER = 1
+
+_executor = None
+_lock = Lock()
+_pending = BoundedSemaphore(max(settings.PASSWORD_HASHING_MAX_PENDING, 1))
+
+
+def get_executor():
+    """
+    Возвращает пул процессов хеширования, создавая его при первом
+    обращении. Процессы запускаются через forkserver, чтобы не
+    наследовать потоки и соединения с базой воркера gunicorn.
+    """
+    global _executor
+    with _lock:
+        if _executor is None:
+            methods = multiprocessing.get_all_start_methods()
+            _executor = ProcessPoolExecutor(
+                settings.PASSWORD_HASHING_WORKERS,
+                mp_context=multiprocessing.get_context(
+                    'forkserver' if 'forkserver' in methods else 'spawn'
+                ),
+                initializer=django.setup
+            )
+        return _executor
+
+
+def shutdown():
+    """Останавливает пул и дожидается завершения его процессов."""
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+
+def run(function, *args):
+    """
+    Выполняет function в пуле процессов, а если пул отключен
+    (PASSWORD_HASHING_WORKERS = 0), то в текущем потоке.
+    Число ожидающих вычислений ограничено, лишние запросы
+    получают ответ 429 вместо того, чтобы занимать воркер.
+    """
+    if settings.PASSWORD_HASHING_WORKERS <= 0:
+        return function(*args)
+    if not _pending.acquire(blocking=False):
+        raise Throttled(
+            wait=HASHING_BUSY_RETRY_AFTER,
+            detail='Слишком много одновременных проверок пароля.'
+        )
+    try:
+        executor = get_executor()
+        try:
+            return executor.submit(function, *args).result()
+        except BrokenProcessPool:
+            logger.exception('Пул хеширования паролей перезапускается')
+            with _lock:
+                global _executor
+                if _executor is executor:
+                    _executor = None
+            return function(*args)
+    finally:
+        _pending.release()
+
+
+def verify(password, encoded):
+    """
+    Проверяет пароль и, если хеш устарел, возвращает новый хеш
+    предпочтительным хешером с текущей стоимостью.
+    """
+    updated = []
+    valid = hashers.check_password(
+        password, encoded,
+        setter=lambda raw: updated.append(hashers.make_password(raw))
+    )
+    return valid, updated[0] if updated else None
+
+
+def make_password(password):
+    """Хеширует пароль вне потока запроса."""
+    return run(hashers.make_password, password)
+
+
+def check_password(user, password):
+    """
+    Проверяет пароль пользователя вне потока запроса и сохраняет
+    пересчитанный хеш, если сменился хешер или его стоимость.
+    """
+    valid, encoded = run(verify, password, user.password)
+    if encoded is not None:
+        user.password = encoded
+        user.save(update_fields=('password',))
+    return valid
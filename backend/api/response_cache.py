@@ -0,0 +1,130 @@
+from collections import OrderedDict
+from threading import Lock
+
+from django.conf import settings
+
+from recipes.models import Recipe, User
+
+
+class LRUCache:
+    """Кэш в памяти процесса с вытеснением давно не читанных записей."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = Lock()
+        self._data = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class RecipeResponseCache:
+    """
+    Кэш ответов списка рецептов из двух слоев.
+
+    Общий слой хранит ответ, построенный для анонимного пользователя,
+    и не зависит от того, кто его запросил. Пользовательский слой
+    хранит только флаги is_favorited, is_in_shopping_cart и
+    is_subscribed для рецептов и авторов страницы и накладывается
+    на копию общего ответа. Ключи включают версии счетчиков изменений,
+    поэтому сигналы записи делают старые записи недостижимыми,
+    а LRU со временем их вытесняет.
+    """
+
+    def __init__(self, shared_entries, user_entries):
+        self.shared = LRUCache(shared_entries)
+        self.overlay = LRUCache(user_entries)
+
+    def stats(self):
+        """Возвращает счетчики попаданий и промахов по слоям."""
+        return {
+            layer: {
+                'hits': cache.hits,
+                'misses': cache.misses,
+                'entries': len(cache),
+            }
+            for layer, cache in (
+                ('shared', self.shared), ('user', self.overlay)
+            )
+        }
+
+    def clear(self):
+        self.shared.clear()
+        self.overlay.clear()
+
+    def get_overlay(self, key, user, results):
+        """Возвращает пользовательские флаги для рецептов страницы."""
+        overlay = self.overlay.get(key)
+        if overlay is None:
+            overlay = self.build_overlay(user, results)
+            self.overlay.set(key, overlay)
+        return overlay
+
+    def build_overlay(self, user, results):
+        recipe_ids = [recipe['id'] for recipe in results]
+        author_ids = {recipe['author']['id'] for recipe in results}
+        return {
+            'favorited': set(
+                Recipe.favorite_recipes.through.objects.filter(
+                    user=user, recipe_id__in=recipe_ids
+                ).values_list('recipe_id', flat=True)
+            ),
+            'in_shopping_cart': set(
+                Recipe.shopping_cart_recipes.through.objects.filter(
+                    user=user, recipe_id__in=recipe_ids
+                ).values_list('recipe_id', flat=True)
+            ),
+            'subscribed': set(
+                User.subscriptions.through.objects.filter(
+                    from_user=user, to_user_id__in=author_ids
+                ).values_list('to_user_id', flat=True)
+            ),
+        }
+
+    @staticmethod
+    def apply_overlay(results, overlay):
+        """Возвращает копию страницы с флагами пользователя."""
+        applied = []
+        for recipe in results:
+            recipe = dict(recipe)
+            author = dict(recipe['author'])
+            author['is_subscribed'] = author['id'] in overlay['subscribed']
+            recipe['author'] = author
+            recipe['is_favorited'] = recipe['id'] in overlay['favorited']
+            recipe['is_in_shopping_cart'] = (
+                recipe['id'] in overlay['in_shopping_cart']
+            )
+            applied.append(recipe)
+        return applied
+
+
+recipe_response_cache = RecipeResponseCache(
+    settings.RESPONSE_CACHE_MAX_ENTRIES,
+    settings.RESPONSE_CACHE_USER_MAX_ENTRIES
+)
@@ -1,17 +1,21 @@
 import webcolors
 
-from django.contrib.auth.hashers import make_password
 from django.core.validators import MaxValueValidator, MinValueValidator
+from django.db import IntegrityError, transaction
 from django.db.models import Q
 from django.shortcuts import get_object_or_404
-from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 from rest_framework.authtoken.models import Token
+from rest_framework.settings import api_settings
 
+from api import passwords
+from api.catalog import ingredient_catalog, tag_catalog
+from api.fields import RecipeImageField, StreamingBase64ImageField
 from recipes.consts import (
-    ERROR_MESSAGE_DELETE_FAV_SHOPPING_CART, ERROR_MESSAGE_SIGNUP,
-    MAX_LEN_EMAIL, MAX_LEN_NAME, MAX_VALUE_AMOUNT, MAX_VALUE_COOKING_TIME,
-    MIN_VALUE_AMOUNT, MIN_VALUE_COOKING_TIME
+    BATCH_MAX_IDS, ERROR_MESSAGE_DELETE_FAV_SHOPPING_CART,
+    ERROR_MESSAGE_SIGNUP, MAX_LEN_EMAIL, MAX_LEN_NAME, MAX_VALUE_AMOUNT,
+    MAX_VALUE_COOKING_TIME, MIN_VALUE_AMOUNT, MIN_VALUE_COOKING_TIME,
+    RECIPE_MATCH_MAX_INGREDIENTS
 )
 from recipes.models import (
     Ingredient, Recipe, RecipeIngredient, RecipeTag, Tag, User
@@ -33,6 +37,8 @@ class UserInfoSerializer(serializers.ModelSerializer):
 
     def get_is_subscribed(self, obj):
         """Возвращает информацию о подписке пользователя."""
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         user = self.context['request'].user
         if user.id is None:
             return False
@@ -77,7 +83,7 @@ class UserSignupSerializer(serializers.ModelSerializer):
             if errors:
                 raise serializers.ValidationError(errors)
 
-        attrs['password'] = make_password(attrs.get('password'))
+        attrs['password'] = passwords.make_password(attrs.get('password'))
         return attrs
 
 
@@ -97,7 +103,7 @@ class UserTokenSerializer(serializers.Serializer):
             User,
             email=attrs.get('email')
         )
-        if not user.check_password(attrs.get('password')):
+        if not passwords.check_password(user, attrs.get('password')):
             raise serializers.ValidationError('Неверный пароль.')
         attrs['user'] = user
         return attrs
@@ -114,7 +120,7 @@ class UserResetPasswordSerializer(serializers.Serializer):
 
     def validate(self, attrs):
         user = self.instance
-        if not user.check_password(attrs['current_password']):
+        if not passwords.check_password(user, attrs['current_password']):
             raise serializers.ValidationError('Неверный пароль.')
         return attrs
 
@@ -199,7 +205,7 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
     )
     ingredients = RecipeIngredientsSerializer(many=True, required=True)
     author = UserInfoSerializer(required=False)
-    image = Base64ImageField(required=False)
+    image = StreamingBase64ImageField(required=False)
     cooking_time = serializers.IntegerField(
         validators=[
             MinValueValidator(
@@ -224,7 +230,11 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         errors_dict = {}
 
     def validate_fill_fields(self, attrs):
-        """Проверяет заполнение обязательных полей."""
+        """
+        Проверяет заполнение обязательных полей. При частичном
+        обновлении (PATCH) непереданные поля остаются прежними,
+        а переданные не могут быть пустыми.
+        """
         errors_dict = {}
         required_fields = [
             'ingredients', 'tags',
@@ -233,6 +243,8 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         if not self.instance:
             required_fields.append('image')
         for field in required_fields:
+            if field not in attrs and self.partial:
+                continue
             if field not in attrs or not attrs[field]:
                 errors_dict[field] = 'Поле обязательно для заполнения.'
         if self.instance and ('image' in attrs and not attrs['image']):
@@ -246,63 +258,96 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         if len(unique_objects) != len(attrs[key]):
             errors_dict[key] = f'Нельзя дублировать {key}.'
 
-    def validate_exists(self, model, ids_list, error_key, errors_dict):
-        """Проверяет существование оъектов в списке."""
-        for id in ids_list:
-            if not model.objects.filter(id=id).exists():
-                errors_dict[error_key] = (f'{error_key} [{id}] '
-                                          'не существует.')
+    def validate_exists(self, catalog, ids_list, error_key, errors_dict):
+        """
+        Проверяет существование оъектов в списке. Отсутствующие в кэше
+        справочника id проверяются одним запросом на случай, если кэш
+        устарел.
+        """
+        missing_ids = set(ids_list) - catalog.ids()
+        if missing_ids:
+            found = catalog.model.objects.in_bulk(missing_ids)
+            if found:
+                catalog.invalidate()
+            missing_ids -= found.keys()
+        if missing_ids:
+            errors_dict[error_key] = (f'{error_key} {sorted(missing_ids)} '
+                                      'не существует.')
 
     def validate(self, attrs):
         self.validate_fill_fields(attrs)
         errors_dict = {}
-        ingredients_id = [ingredient['ingredient']['id']
-                          for ingredient in attrs['ingredients']]
-        tags_id = attrs['tags']
-        self.validate_unique_items(
-            ingredients_id,
-            attrs,
-            'ingredients',
-            errors_dict
-        )
-        self.validate_unique_items(
-            tags_id, attrs, 'tags', errors_dict
-        )
-        self.validate_exists(
-            Ingredient,
-            ingredients_id,
-            'ingredients',
-            errors_dict
-        )
-        self.validate_exists(Tag, tags_id, 'tags', errors_dict)
+        if 'ingredients' in attrs:
+            ingredients_id = [ingredient['ingredient']['id']
+                              for ingredient in attrs['ingredients']]
+            self.validate_unique_items(
+                ingredients_id,
+                attrs,
+                'ingredients',
+                errors_dict
+            )
+            self.validate_exists(
+                ingredient_catalog,
+                ingredients_id,
+                'ingredients',
+                errors_dict
+            )
+        if 'tags' in attrs:
+            tags_id = attrs['tags']
+            self.validate_unique_items(
+                tags_id, attrs, 'tags', errors_dict
+            )
+            self.validate_exists(tag_catalog, tags_id, 'tags', errors_dict)
         if errors_dict:
             raise serializers.ValidationError(errors_dict)
         return attrs
 
     def add_tags(self, recipe, tags_data):
         """Добавляет теги к рецепту."""
+        if not tags_data:
+            return
         RecipeTag.objects.bulk_create(
             [
-                RecipeTag(
-                    tag=Tag.objects.get(id=tag_id), recipe=recipe
-                ) for tag_id in tags_data
+                RecipeTag(tag_id=tag_id, recipe=recipe)
+                for tag_id in tags_data
             ]
         )
 
     def add_ingredients(self, recipe, ingredients_data):
         """Добавляет ингредиенты к рецепту."""
+        if not ingredients_data:
+            return
         RecipeIngredient.objects.bulk_create(
             [
                 RecipeIngredient(
-                    ingredient=Ingredient.objects.get(
-                        id=ingredient_data['ingredient']['id']
-                    ),
+                    ingredient_id=ingredient_data['ingredient']['id'],
                     amount=ingredient_data['amount'],
                     recipe=recipe
                 ) for ingredient_data in ingredients_data
             ]
         )
 
+    def save(self, **kwargs):
+        """
+        Тег или ингредиент может быть удален другим запросом уже после
+        проверки: тогда ссылка на него нарушает внешний ключ при записи
+        или фиксации транзакции, и клиент получает ошибку валидации.
+        """
+        try:
+            return super().save(**kwargs)
+        except IntegrityError:
+            raise serializers.ValidationError({
+                api_settings.NON_FIELD_ERRORS_KEY: [
+                    'Теги или ингредиенты рецепта удалены, '
+                    'обновите справочники и повторите запрос.'
+                ]
+            })
+        finally:
+            image = self.validated_data.get('image')
+            if image:
+                image.close()
+
+    @transaction.atomic
     def create(self, validated_data):
         tags_data = validated_data.pop('tags')
         ingredients_data = validated_data.pop('ingredients')
@@ -311,20 +356,63 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         self.add_tags(recipe, tags_data)
         return recipe
 
+    def update_tags(self, recipe, tags_data):
+        """Приводит теги рецепта к переданным, меняя только разницу."""
+        existing_ids = set(
+            recipe.tags.order_by().values_list('tag_id', flat=True)
+        )
+        new_ids = set(tags_data)
+        if existing_ids - new_ids:
+            recipe.tags.filter(tag_id__in=existing_ids - new_ids).delete()
+        self.add_tags(recipe, [
+            tag_id for tag_id in tags_data if tag_id not in existing_ids
+        ])
+
+    def update_ingredients(self, recipe, ingredients_data):
+        """
+        Приводит ингредиенты рецепта к переданным, меняя только разницу.
+        """
+        existing = {
+            recipe_ingredient.ingredient_id: recipe_ingredient
+            for recipe_ingredient in recipe.ingredients.order_by()
+        }
+        amounts = {
+            ingredient_data['ingredient']['id']: ingredient_data['amount']
+            for ingredient_data in ingredients_data
+        }
+        removed_ids = existing.keys() - amounts.keys()
+        if removed_ids:
+            recipe.ingredients.filter(ingredient_id__in=removed_ids).delete()
+        changed = []
+        for ingredient_id, recipe_ingredient in existing.items():
+            amount = amounts.get(ingredient_id)
+            if amount is not None and recipe_ingredient.amount != amount:
+                recipe_ingredient.amount = amount
+                changed.append(recipe_ingredient)
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ('amount',))
+        self.add_ingredients(recipe, [
+            ingredient_data for ingredient_data in ingredients_data
+            if ingredient_data['ingredient']['id'] not in existing
+        ])
+
+    @transaction.atomic
     def update(self, instance, validated_data):
-        tags_data = validated_data.pop('tags')
-        ingredients_data = validated_data.pop('ingredients')
+        tags_data = validated_data.pop('tags', None)
+        ingredients_data = validated_data.pop('ingredients', None)
         recipe = super().update(instance, validated_data)
-        recipe.ingredients.all().delete()
-        recipe.tags.all().delete()
-        self.add_ingredients(recipe, ingredients_data)
-        self.add_tags(recipe, tags_data)
+        if ingredients_data is not None:
+            self.update_ingredients(recipe, ingredients_data)
+        if tags_data is not None:
+            self.update_tags(recipe, tags_data)
         return recipe
 
     def to_representation(self, instance):
+        request = self.context.get('request')
+        user = request.user if request else None
         serializer = RecipeReadSerializer(
-            instance,
-            context={'request': self.context.get('request')}
+            Recipe.objects.for_read(user).get(pk=instance.pk),
+            context={'request': request}
         ).data
         return serializer
 
@@ -335,7 +423,7 @@ class RecipeReadSerializer(serializers.ModelSerializer):
     tags = serializers.SerializerMethodField()
     ingredients = serializers.SerializerMethodField()
     author = UserInfoSerializer()
-    image = Base64ImageField()
+    image = RecipeImageField('detail', list_rendition='thumbnail')
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
 
@@ -349,24 +437,28 @@ class RecipeReadSerializer(serializers.ModelSerializer):
     def get_tags(self, obj):
         """Получает теги рецепта."""
         return TagSerializer(
-            Tag.objects.filter(recipes__recipe=obj),
+            [recipe_tag.tag for recipe_tag in obj.tags.all()],
             many=True
         ).data
 
     def get_ingredients(self, obj):
         """Получает ингредиенты рецепта."""
         return RecipeIngredientsSerializer(
-            obj.ingredients,
+            obj.ingredients.all(),
             many=True
         ).data
 
     def get_is_favorited(self, obj):
         """Получает информацию о добавлении рецепта в избранное."""
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         user = self.context['request'].user
         return obj.favorite_recipes.filter(id=user.id).exists()
 
     def get_is_in_shopping_cart(self, obj):
         """Получает информацию о добавлении рецепта в список покупок."""
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         user = self.context['request'].user
         return obj.shopping_cart_recipes.filter(id=user.id).exists()
 
@@ -374,12 +466,74 @@ class RecipeReadSerializer(serializers.ModelSerializer):
 class RecipeShortInfoSerializer(serializers.ModelSerializer):
     """Сериализатор краткой информации рецепта."""
 
+    image = RecipeImageField('thumbnail')
+
     class Meta:
         model = Recipe
         fields = ('id', 'name', 'image', 'cooking_time')
         read_only_fields = ('id', 'name', 'image', 'cooking_time')
 
 
+class RecipeDetailSerializer(RecipeReadSerializer):
+    """Сериализатор просмотра рецепта с похожими рецептами."""
+
+    similar = serializers.SerializerMethodField()
+
+    class Meta(RecipeReadSerializer.Meta):
+        fields = RecipeReadSerializer.Meta.fields + ('similar',)
+
+    def get_similar(self, obj):
+        """Получает похожие рецепты, рассчитанные заранее."""
+        return RecipeShortInfoSerializer(
+            [similarity.similar for similarity in obj.similarities.all()],
+            many=True,
+            context=self.context
+        ).data
+
+
+class RecipeMatchQuerySerializer(serializers.Serializer):
+    """Сериализатор параметров подбора рецептов по продуктам."""
+
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=RECIPE_MATCH_MAX_INGREDIENTS
+    )
+
+
+class RecipeMatchSerializer(RecipeShortInfoSerializer):
+    """
+    Сериализатор рецепта, подобранного по продуктам: доля имеющихся
+    ингредиентов и недостающие ингредиенты.
+    """
+
+    coverage = serializers.FloatField()
+    matched_count = serializers.IntegerField()
+    ingredients_count = serializers.IntegerField()
+    missing = RecipeIngredientsSerializer(
+        source='missing_ingredients', many=True
+    )
+
+    class Meta(RecipeShortInfoSerializer.Meta):
+        fields = RecipeShortInfoSerializer.Meta.fields + (
+            'coverage', 'matched_count', 'ingredients_count', 'missing'
+        )
+        read_only_fields = fields
+
+
+class BatchIdsSerializer(serializers.Serializer):
+    """Сериализатор списка id для пакетного добавления и удаления."""
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=BATCH_MAX_IDS
+    )
+
+    def validate_ids(self, value):
+        return list(dict.fromkeys(value))
+
+
 class FavoriteAddSerializer(RecipeShortInfoSerializer):
     """Сериализатор добавления рецепта в избранное."""
 
@@ -414,6 +568,24 @@ class ShoppingCartSerializer(RecipeShortInfoSerializer):
         return self.instance
 
 
+class UserSubscriptionListSerializer(serializers.ListSerializer):
+    """
+    Сериализатор списка подписок. Рецепты всех авторов страницы
+    загружает одним запросом.
+    """
+
+    def to_representation(self, data):
+        authors = list(data.all() if hasattr(data, 'all') else data)
+        recipes = {author.id: [] for author in authors}
+        for recipe in Recipe.objects.latest_by_authors(
+            recipes, self.child.get_recipes_limit()
+        ):
+            recipes[recipe.author_id].append(recipe)
+        for author in authors:
+            author.recipes_preview = recipes[author.id]
+        return super().to_representation(authors)
+
+
 class UserSubscriptionSerializer(UserInfoSerializer):
     """Сериализатор подписок пользователя."""
 
@@ -426,6 +598,7 @@ class UserSubscriptionSerializer(UserInfoSerializer):
             'id', 'email', 'username',
             'first_name', 'last_name'
         )
+        list_serializer_class = UserSubscriptionListSerializer
 
     def validate(self, attrs):
         user = self.context['request'].user
@@ -443,14 +616,24 @@ class UserSubscriptionSerializer(UserInfoSerializer):
         user.subscriptions.add(self.instance)
         return self.instance
 
+    def get_recipes_limit(self):
+        """Возвращает ограничение числа рецептов из запроса."""
+        try:
+            recipes_limit = int(
+                self.context['request'].query_params['recipes_limit']
+            )
+        except (KeyError, ValueError):
+            return None
+        return max(recipes_limit, 0)
+
     def get_recipes(self, obj):
         """Получает рецепты автора, на которого подписан пользователь."""
-        recipes_limit = self.context['request'].query_params.get(
-            'recipes_limit'
-        )
-        queryset = Recipe.objects.filter(author=obj)
-        if recipes_limit:
-            queryset = queryset[:int(recipes_limit)]
+        if hasattr(obj, 'recipes_preview'):
+            queryset = obj.recipes_preview
+        else:
+            queryset = Recipe.objects.latest_by_authors(
+                (obj.id,), self.get_recipes_limit()
+            )
         return RecipeShortInfoSerializer(queryset, many=True).data
 
     def get_recipes_count(self, obj):
@@ -458,4 +641,10 @@ class UserSubscriptionSerializer(UserInfoSerializer):
         Получает кол-во рецептов автора,
         на которого подписан пользователь.
         """
-        return obj.recipes.count()
+        return obj.recipes_count
+
+
+class MetricsSettingsSerializer(serializers.Serializer):
+    """Сериализатор настроек сбора метрик."""
+
+    sample_rate = serializers.FloatField(min_value=0, max_value=1)
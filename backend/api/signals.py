@@ -0,0 +1,39 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from api.authentication import token_cache
+from api.catalog import ingredient_catalog, tag_catalog
+from recipes.models import Ingredient, Tag, User
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tag_catalog(**kwargs):
+    """
+    Сбрасывает кэш справочника тегов после фиксации транзакции,
+    иначе другой запрос успеет закэшировать старые данные
+    под новой версией.
+    """
+    transaction.on_commit(tag_catalog.invalidate)
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredient_catalog(**kwargs):
+    """Сбрасывает кэш справочника ингредиентов после фиксации транзакции."""
+    transaction.on_commit(ingredient_catalog.invalidate)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(instance, **kwargs):
+    """Сбрасывает кэш аутентификации при выходе из системы."""
+    token_cache.invalidate((instance.key,))
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(instance, **kwargs):
+    """
+    Сбрасывает кэш аутентификации при изменении пользователя:
+    смене пароля, блокировке и правке профиля.
+    """
+    token_cache.invalidate_user(instance.pk)
@@ -0,0 +1,693 @@
+from base64 import b64encode
+from datetime import timedelta
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+from django.conf import settings
+from django.db import connection
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory, APITestCase
+
+from api.authentication import AUTH_CACHE, token_cache
+from api.catalog import ingredient_catalog
+from api.metrics import metrics
+from api.pagination import RecipeKeysetPagination
+from api.response_cache import recipe_response_cache
+from api.serializers import RecipeCreateSerializer
+from recipes import changes
+from recipes.models import (
+    Ingredient, Recipe, RecipeIngredient, RecipeTag, Tag, User
+)
+from recipes.timeline import fan_out
+
+
+class RecipeQueryCountTests(APITestCase):
+    """Число запросов к базе не зависит от размера страницы."""
+
+    @classmethod
+    def setUpTestData(cls):
+        users = [
+            User.objects.create(
+                username=f'user{number}',
+                email=f'user{number}@example.com',
+                first_name='Имя',
+                last_name='Фамилия'
+            )
+            for number in range(5)
+        ]
+        cls.user = users[0]
+        tags = [
+            Tag.objects.create(
+                name=f'Тег {number}', color=f'#00000{number}',
+                slug=f'tag-{number}'
+            )
+            for number in range(3)
+        ]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}', measurement_unit='г'
+            )
+            for number in range(6)
+        ]
+        cls.recipes = []
+        for number in range(45):
+            recipe = Recipe.objects.create(
+                author=users[number % len(users)],
+                name=f'Рецепт {number}',
+                text='Описание',
+                cooking_time=10
+            )
+            RecipeTag.objects.bulk_create(
+                RecipeTag(recipe=recipe, tag=tag)
+                for tag in tags[:number % len(tags) + 1]
+            )
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(recipe=recipe, ingredient=ingredient,
+                                 amount=number + 1)
+                for ingredient in ingredients[:number % 5 + 2]
+            )
+            recipe.favorite_recipes.add(*users[:number % len(users)])
+            if number % 2:
+                recipe.shopping_cart_recipes.add(cls.user)
+            cls.recipes.append(recipe)
+        cls.user.subscriptions.add(*users[1:3])
+
+    def setUp(self):
+        recipe_response_cache.clear()
+
+    def count_queries(self, path):
+        recipe_response_cache.clear()
+        # Доля измеряемых запросов перечитывается из базы раз в несколько
+        # секунд, этот запрос не относится к проверяемому ответу.
+        metrics.sample_rate()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def assert_list_queries_constant(self):
+        self.assertEqual(
+            self.count_queries('/api/recipes/?limit=5'),
+            self.count_queries('/api/recipes/?limit=40')
+        )
+
+    def assert_detail_queries_constant(self):
+        # У первого рецепта один тег и два ингредиента, у последнего —
+        # три тега, шесть ингредиентов и добавления в избранное.
+        self.assertEqual(
+            self.count_queries(f'/api/recipes/{self.recipes[0].pk}/'),
+            self.count_queries(f'/api/recipes/{self.recipes[-1].pk}/')
+        )
+
+    def test_list_anonymous(self):
+        self.assert_list_queries_constant()
+
+    def test_list_authenticated(self):
+        self.client.force_authenticate(self.user)
+        self.assert_list_queries_constant()
+
+    def test_detail_anonymous(self):
+        self.assert_detail_queries_constant()
+
+    def test_detail_authenticated(self):
+        self.client.force_authenticate(self.user)
+        self.assert_detail_queries_constant()
+
+
+class FeedTests(APITestCase):
+    """Лента подписок."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.follower, cls.newcomer = (
+            User.objects.create(
+                username=username, email=f'{username}@example.com'
+            )
+            for username in ('author', 'follower', 'newcomer')
+        )
+
+    def create_recipe(self):
+        return Recipe.objects.create(
+            author=self.author, name='Рецепт', text='Описание',
+            cooking_time=10
+        )
+
+    def feed_ids(self, user):
+        self.client.force_authenticate(user)
+        response = self.client.get('/api/users/feed/')
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def test_recipes_fanned_out_before_author_passed_threshold(self):
+        self.follower.subscriptions.add(self.author)
+        recipe = self.create_recipe()
+        fan_out((recipe.pk,))
+        with mock.patch(
+            'recipes.timeline.TIMELINE_FANOUT_MAX_SUBSCRIBERS', 1
+        ):
+            self.newcomer.subscriptions.add(self.author)
+            self.assertEqual(self.feed_ids(self.newcomer), [recipe.pk])
+            self.assertEqual(self.feed_ids(self.follower), [recipe.pk])
+
+    def test_fan_out_error_is_logged(self):
+        self.follower.subscriptions.add(self.author)
+        with mock.patch('recipes.timeline.executor', None), mock.patch(
+            'recipes.timeline.fan_out', side_effect=RuntimeError
+        ), self.assertLogs('recipes.timeline', 'ERROR'):
+            with self.captureOnCommitCallbacks(execute=True):
+                recipe = self.create_recipe()
+        self.assertEqual(self.feed_ids(self.follower), [recipe.pk])
+
+
+class TokenAuthenticationTests(APITestCase):
+    """Отозванный токен не принимается ни одним процессом."""
+
+    def setUp(self):
+        self.user = User.objects.create(
+            username='user', email='user@example.com'
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def assert_deleted_token_rejected(self):
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/auth/token/logout/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 401)
+
+    def test_local_cache_is_not_used(self):
+        self.assertFalse(token_cache.enabled)
+        self.assert_deleted_token_rejected()
+
+    def test_shared_cache(self):
+        with TemporaryDirectory() as location, override_settings(CACHES={
+            **settings.CACHES,
+            AUTH_CACHE: {
+                'BACKEND': 'django.core.cache.backends.filebased.'
+                           'FileBasedCache',
+                'LOCATION': location,
+            },
+        }):
+            self.assertTrue(token_cache.enabled)
+            self.assert_deleted_token_rejected()
+
+
+class RecipeCreateSerializerTests(APITestCase):
+    """Сериализатор записи рецепта."""
+
+    def test_representation_without_request(self):
+        author = User.objects.create(
+            username='author', email='author@example.com'
+        )
+        recipe = Recipe.objects.create(
+            author=author, name='Рецепт', text='Описание', cooking_time=10
+        )
+        data = RecipeCreateSerializer(recipe).data
+        self.assertEqual(data['id'], recipe.pk)
+        self.assertFalse(data['is_favorited'])
+        self.assertFalse(data['is_in_shopping_cart'])
+
+
+class CatalogValidationTests(TransactionTestCase):
+    """Проверка тегов и ингредиентов рецепта по справочникам."""
+
+    def setUp(self):
+        self.user = User.objects.create(
+            username='author', email='author@example.com'
+        )
+        self.tag = Tag.objects.create(
+            name='Тег', color='#000000', slug='tag'
+        )
+        self.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}', measurement_unit='г'
+            )
+            for number in range(2)
+        ]
+        self.recipe = Recipe.objects.create(
+            author=self.user, name='Рецепт', text='Описание',
+            cooking_time=10
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def update_recipe(self, ingredient_id):
+        return self.client.patch(
+            f'/api/recipes/{self.recipe.pk}/',
+            {
+                'tags': [self.tag.pk],
+                'ingredients': [{'id': ingredient_id, 'amount': 10}],
+                'name': 'Рецепт',
+                'text': 'Описание',
+                'cooking_time': 10,
+            },
+            format='json'
+        )
+
+    def test_ingredient_deleted_in_another_process(self):
+        pk = self.ingredients[0].pk
+        self.assertIn(pk, ingredient_catalog.ids())
+        # Другой процесс не сбрасывает кэш этого процесса, но его
+        # удаление увеличивает общий счетчик изменений.
+        with mock.patch.object(ingredient_catalog, 'invalidate'):
+            self.ingredients[0].delete()
+        self.assertNotIn(pk, ingredient_catalog.ids())
+        self.assertEqual(self.update_recipe(pk).status_code, 400)
+
+    def test_ingredient_deleted_after_validation(self):
+        missing_id = self.ingredients[-1].pk + 1
+        with mock.patch.object(
+            ingredient_catalog, 'ids',
+            return_value={ingredient.pk for ingredient in self.ingredients}
+            | {missing_id}
+        ):
+            response = self.update_recipe(missing_id)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(self.recipe.ingredients.exists())
+
+
+class RecipeUpdateTests(APITestCase):
+    """Частичное обновление рецепта."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(
+            username='author', email='author@example.com'
+        )
+        cls.tag = Tag.objects.create(name='Тег', color='#000000', slug='tag')
+        cls.ingredient = Ingredient.objects.create(
+            name='Ингредиент', measurement_unit='г'
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Рецепт', text='Описание',
+            cooking_time=10
+        )
+        RecipeTag.objects.create(recipe=cls.recipe, tag=cls.tag)
+        RecipeIngredient.objects.create(
+            recipe=cls.recipe, ingredient=cls.ingredient, amount=5
+        )
+
+    def setUp(self):
+        self.client.force_authenticate(self.author)
+
+    def test_patch_keeps_tags_and_ingredients(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(
+                f'/api/recipes/{self.recipe.pk}/', {'name': 'Новое название'},
+                format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['name'], 'Новое название')
+        self.assertEqual(
+            [tag['id'] for tag in response.data['tags']], [self.tag.pk]
+        )
+        self.assertEqual(
+            [(item['id'], item['amount'])
+             for item in response.data['ingredients']],
+            [(self.ingredient.pk, 5)]
+        )
+        self.assertFalse([
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith(('INSERT', 'DELETE'))
+        ])
+
+    def test_patch_rejects_empty_fields(self):
+        response = self.client.patch(
+            f'/api/recipes/{self.recipe.pk}/', {'tags': []}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.data), {'tags'})
+
+
+class ChangeCounterTests(TransactionTestCase):
+    """Счетчики изменений для условных запросов."""
+
+    def test_recipe_delete_bumps_once(self):
+        author = User.objects.create(
+            username='author', email='author@example.com'
+        )
+        recipe = Recipe.objects.create(
+            author=author, name='Рецепт', text='Описание', cooking_time=10
+        )
+        for number in range(5):
+            RecipeIngredient.objects.create(
+                recipe=recipe,
+                ingredient=Ingredient.objects.create(
+                    name=f'Ингредиент {number}', measurement_unit='г'
+                ),
+                amount=1
+            )
+        (version,), _ = changes.read((changes.RECIPES,))
+        with CaptureQueriesContext(connection) as queries:
+            recipe.delete()
+        self.assertEqual(changes.read((changes.RECIPES,))[0], [version + 1])
+        self.assertEqual(len([
+            query for query in queries.captured_queries
+            if query['sql'].startswith('UPDATE')
+            and 'changecounter' in query['sql']
+        ]), 1)
+
+
+class BatchLinkTests(APITestCase):
+    """Пакетные подписки, избранное и список покупок."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, *cls.authors = (
+            User.objects.create(
+                username=f'user{number}', email=f'user{number}@example.com'
+            )
+            for number in range(22)
+        )
+        cls.recipes = [
+            Recipe.objects.create(
+                author=cls.authors[number % len(cls.authors)],
+                name=f'Рецепт {number}', text='Описание', cooking_time=10
+            )
+            for number in range(22)
+        ]
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def link(self, method, path, ids):
+        response = getattr(self.client, method)(
+            path, {'ids': ids}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        return [
+            (result['id'], result['status'])
+            for result in response.data['results']
+        ]
+
+    def test_favorite_mixed_ids(self):
+        first, second, third = self.recipes[:3]
+        self.user.favorite_recipes.add(first)
+        missing_id = self.recipes[-1].pk + 1
+        self.assertEqual(
+            self.link(
+                'post', '/api/recipes/favorite/',
+                [first.pk, second.pk, missing_id]
+            ),
+            [(first.pk, 400), (second.pk, 201), (missing_id, 400)]
+        )
+        self.assertEqual(
+            self.link(
+                'delete', '/api/recipes/favorite/',
+                [second.pk, third.pk, missing_id]
+            ),
+            [(second.pk, 204), (third.pk, 400), (missing_id, 404)]
+        )
+        self.assertEqual(
+            list(self.user.favorite_recipes.all()), [first]
+        )
+        second.refresh_from_db()
+        self.assertEqual(second.favorites_count, 0)
+
+    def test_shopping_cart_mixed_ids(self):
+        first, second = self.recipes[:2]
+        self.user.shopping_cart_recipes.add(first)
+        self.assertEqual(
+            self.link(
+                'post', '/api/recipes/shopping_cart/', [first.pk, second.pk]
+            ),
+            [(first.pk, 400), (second.pk, 201)]
+        )
+        self.assertEqual(
+            set(self.user.shopping_cart_recipes.all()), {first, second}
+        )
+
+    def test_subscribe_mixed_ids(self):
+        first, second = self.authors[:2]
+        self.user.subscriptions.add(first)
+        missing_id = self.authors[-1].pk + 1
+        self.assertEqual(
+            self.link(
+                'post', '/api/users/subscribe/',
+                [first.pk, second.pk, missing_id]
+            ),
+            [(first.pk, 400), (second.pk, 201), (missing_id, 404)]
+        )
+        self.assertEqual(
+            set(self.user.subscriptions.all()), {first, second}
+        )
+        second.refresh_from_db()
+        self.assertEqual(second.subscribers_count, 1)
+
+    def test_self_subscribe(self):
+        author = self.authors[0]
+        self.assertEqual(
+            self.link(
+                'post', '/api/users/subscribe/', [self.user.pk, author.pk]
+            ),
+            [(self.user.pk, 400), (author.pk, 201)]
+        )
+        self.assertEqual(list(self.user.subscriptions.all()), [author])
+
+    def test_invalid_ids(self):
+        for ids in ([], [0], ['id']):
+            with self.subTest(ids=ids):
+                response = self.client.post(
+                    '/api/recipes/favorite/', {'ids': ids}, format='json'
+                )
+                self.assertEqual(response.status_code, 400)
+
+    def count_queries(self, method, path, ids):
+        with CaptureQueriesContext(connection) as queries:
+            self.link(method, path, ids)
+        return len(queries)
+
+    def assert_queries_constant(self, path, objects):
+        ids = [item.pk for item in objects]
+        for method in ('post', 'delete'):
+            with self.subTest(method=method):
+                self.assertEqual(
+                    self.count_queries(method, path, ids[:2]),
+                    self.count_queries(method, path, ids[2:])
+                )
+
+    def test_favorite_queries_constant(self):
+        self.assert_queries_constant('/api/recipes/favorite/', self.recipes)
+
+    def test_shopping_cart_queries_constant(self):
+        self.assert_queries_constant(
+            '/api/recipes/shopping_cart/', self.recipes
+        )
+
+    def test_subscribe_queries_constant(self):
+        self.assert_queries_constant('/api/users/subscribe/', self.authors)
+
+
+class KeysetPaginationTests(APITestCase):
+    """Пагинация рецептов и подписок по курсору."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, *cls.authors = (
+            User.objects.create(
+                username=f'user{number:02}',
+                email=f'user{number}@example.com'
+            )
+            for number in range(12)
+        )
+        cls.user.subscriptions.add(*cls.authors)
+        recipes = [
+            Recipe.objects.create(
+                author=cls.authors[0], name=f'Рецепт {number}',
+                text='Описание', cooking_time=10
+            )
+            for number in range(11)
+        ]
+        # По три рецепта с одинаковой датой публикации: граница
+        # страницы из трех записей приходится внутрь группы.
+        published = timezone.now()
+        for number, recipe in enumerate(recipes):
+            Recipe.objects.filter(pk=recipe.pk).update(
+                pub_date=published - timedelta(days=number // 3)
+            )
+        cls.recipe_ids = list(
+            Recipe.objects.order_by('-pub_date', '-id').values_list(
+                'id', flat=True
+            )
+        )
+        cls.author_ids = [author.pk for author in cls.authors]
+
+    def setUp(self):
+        recipe_response_cache.clear()
+        self.client.force_authenticate(self.user)
+
+    def walk(self, url, direction):
+        """
+        Проходит страницы по ссылкам direction, возвращает id записей
+        страниц и последний ответ.
+        """
+        pages = []
+        while True:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)
+            pages.append([item['id'] for item in response.data['results']])
+            url = response.data[direction]
+            if url is None:
+                return pages, response
+
+    def assert_walks_both_ways(self, path, ids):
+        pages, last = self.walk(f'{path}?cursor=&limit=3', 'next')
+        self.assertEqual([pk for page in pages for pk in page], ids)
+        self.assertEqual(
+            [len(page) for page in pages], [3] * (len(ids) // 3) + [2]
+        )
+        backward, first = self.walk(last.data['previous'], 'previous')
+        self.assertEqual(backward, pages[-2::-1])
+        self.assertIsNone(first.data['previous'])
+
+    def test_recipes_with_equal_pub_date(self):
+        self.assert_walks_both_ways('/api/recipes/', self.recipe_ids)
+
+    def test_subscriptions(self):
+        self.assert_walks_both_ways(
+            '/api/users/subscriptions/', self.author_ids
+        )
+
+    def test_cursor_round_trip(self):
+        recipe = Recipe.objects.get(pk=self.recipe_ids[4])
+        paginator = RecipeKeysetPagination()
+        paginator.base_url = 'http://testserver/api/recipes/'
+        for reverse in (False, True):
+            with self.subTest(reverse=reverse):
+                url = paginator.encode_cursor(recipe, reverse)
+                request = Request(APIRequestFactory().get(url))
+                self.assertEqual(
+                    paginator.decode_cursor(request, Recipe),
+                    ([recipe.pub_date, recipe.pk], reverse)
+                )
+
+    def test_tampered_cursor(self):
+        for cursor in (
+            'not-base64!',
+            b64encode(b'id=1').decode(),
+            b64encode(b'pub_date=yesterday&id=1').decode(),
+            b64encode(b'\xff').decode(),
+        ):
+            with self.subTest(cursor=cursor):
+                response = self.client.get(
+                    '/api/recipes/', {'cursor': cursor}
+                )
+                self.assertEqual(response.status_code, 400)
+
+
+class ConditionalResponseTests(APITestCase):
+    """Условные запросы и общий кэш списка рецептов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.user, cls.other = (
+            User.objects.create(
+                username=username, email=f'{username}@example.com'
+            )
+            for username in ('author', 'user', 'other')
+        )
+        cls.recipes = [
+            Recipe.objects.create(
+                author=cls.author, name=f'Рецепт {number}',
+                text='Описание', cooking_time=10
+            )
+            for number in range(3)
+        ]
+
+    def setUp(self):
+        recipe_response_cache.clear()
+
+    def get(self, path, user=None, **headers):
+        self.client.force_authenticate(user)
+        return self.client.get(path, **headers)
+
+    def flags(self, response):
+        return {
+            recipe['id']: (
+                recipe['is_favorited'], recipe['is_in_shopping_cart'],
+                recipe['author']['is_subscribed']
+            )
+            for recipe in response.data['results']
+        }
+
+    def test_not_modified(self):
+        for path in ('/api/recipes/', f'/api/recipes/{self.recipes[0].pk}/'):
+            with self.subTest(path=path):
+                response = self.get(path, self.user)
+                self.assertEqual(response.status_code, 200)
+                vary = {
+                    header.strip()
+                    for header in response['Vary'].split(',')
+                }
+                self.assertLessEqual({'Accept', 'Authorization'}, vary)
+                etag = response['ETag']
+                response = self.get(path, self.user, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response['ETag'], etag)
+                self.assertFalse(response.content)
+                self.assertNotEqual(
+                    self.get(path, self.other)['ETag'], etag
+                )
+
+    def test_cache_status(self):
+        self.assertEqual(self.get('/api/recipes/')['X-Cache'], 'MISS')
+        self.assertEqual(self.get('/api/recipes/')['X-Cache'], 'HIT')
+        self.assertEqual(
+            self.get('/api/recipes/', self.user)['X-Cache'], 'HIT'
+        )
+        self.assertEqual(
+            self.get('/api/recipes/?limit=1', self.user)['X-Cache'], 'MISS'
+        )
+        # Фильтры по флагам пользователя общий слой не используют.
+        self.assertNotIn(
+            'X-Cache', self.get('/api/recipes/?is_favorited=1', self.user)
+        )
+
+    def test_favorite_changes_etag(self):
+        recipe = self.recipes[0]
+        etag = self.get('/api/recipes/', self.user)['ETag']
+        other_etag = self.get('/api/recipes/', self.other)['ETag']
+        self.client.force_authenticate(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/recipes/{recipe.pk}/favorite/')
+        self.assertEqual(response.status_code, 201)
+        response = self.get(
+            '/api/recipes/', self.user, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn('Last-Modified', response)
+        self.assertTrue(self.flags(response)[recipe.pk][0])
+        response = self.get(
+            '/api/recipes/', self.other, HTTP_IF_NONE_MATCH=other_etag
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_shared_cache_does_not_leak_user_flags(self):
+        favorite, in_cart, _ = self.recipes
+        self.user.favorite_recipes.add(favorite)
+        self.user.shopping_cart_recipes.add(in_cart)
+        self.user.subscriptions.add(self.author)
+        expected = {
+            recipe.pk: (recipe == favorite, recipe == in_cart, True)
+            for recipe in self.recipes
+        }
+        clean = dict.fromkeys(expected, (False, False, False))
+        for first, second in (
+            (self.user, None), (self.user, self.other), (None, self.user)
+        ):
+            with self.subTest(first=first, second=second):
+                recipe_response_cache.clear()
+                for user, cache_status in ((first, 'MISS'), (second, 'HIT')):
+                    response = self.get('/api/recipes/', user)
+                    self.assertEqual(response['X-Cache'], cache_status)
+                    self.assertEqual(
+                        self.flags(response),
+                        expected if user == self.user else clean
+                    )
@@ -2,7 +2,7 @@ from django.urls import include, path
 from rest_framework import routers
 
 from api.views import (
-    IngredientViewSet, RecipeViewSet, TagViewSet,
+    IngredientViewSet, MetricsView, RecipeViewSet, TagViewSet,
     UserToken, UserViewSet
 )
 
@@ -15,6 +15,7 @@ router_v1.register('ingredients', IngredientViewSet, basename='ingredients')
 router_v1.register('recipes', RecipeViewSet, basename='recipes')
 
 urlpatterns = [
+    path('metrics/', MetricsView.as_view()),
     path('', include(router_v1.urls)),
     path('auth/token/login/', UserToken.as_view()),
     path('auth/', include('djoser.urls')),
@@ -0,0 +1,34 @@
+import csv
+
+from recipes.consts import SHOPPING_CART_HEADER
+
+
+class Echo:
+    """Псевдобуфер, возвращающий записанную строку вместо хранения."""
+
+    def write(self, value):
+        return value
+
+
+def shopping_cart_csv(rows):
+    """Построчно формирует список покупок в формате CSV."""
+    writer = csv.writer(Echo())
+    yield writer.writerow(SHOPPING_CART_HEADER)
+    for row in rows:
+        yield writer.writerow(
+            (row['name'], row['measurement_unit'], row['amount'])
+        )
+
+
+def shopping_cart_txt(rows):
+    """Построчно формирует список покупок в текстовом формате."""
+    yield 'Список покупок\n\n'
+    for number, row in enumerate(rows, start=1):
+        yield (f'{number}. {row["name"]} '
+               f'({row["measurement_unit"]}) — {row["amount"]}\n')
+
+
+SHOPPING_CART_RENDERERS = {
+    'csv': ('text/csv; charset=utf-8', shopping_cart_csv),
+    'txt': ('text/plain; charset=utf-8', shopping_cart_txt),
+}
@@ -1,26 +1,47 @@
-import csv
-
-from django.db.models import Q
-from django.http import HttpResponse
+from django.db.models import Exists, F, OuterRef, Prefetch, Sum, Value
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
+from api import passwords
+from api.batch import link_batch
+from api.catalog import ingredient_catalog, tag_catalog
 from api.filters import IngredientFilter, RecipeFilter
-from api.mixins import UserAuthMixin
-from api.pagination import GeneralPagination
+from api.metrics import metrics, render_cache_stats
+from api.mixins import (
+    CatalogMixin, ConditionalGetMixin, KeysetPaginationMixin,
+    ResponseCacheMixin, UserAuthMixin
+)
+from api.pagination import (
+    FeedKeysetPagination, GeneralPagination, RecipeKeysetPagination,
+    SubscriptionKeysetPagination
+)
 from api.permissions import IsAuthorOrReadOnly
+from api.response_cache import recipe_response_cache
 from api.serializers import (
-    FavoriteAddSerializer, IngredientSerializer, RecipeCreateSerializer,
-    RecipeReadSerializer, ShoppingCartSerializer, TagSerializer,
-    UserInfoSerializer, UserResetPasswordSerializer, UserSignupSerializer,
+    BatchIdsSerializer, FavoriteAddSerializer, IngredientSerializer,
+    MetricsSettingsSerializer, RecipeCreateSerializer, RecipeDetailSerializer,
+    RecipeMatchQuerySerializer, RecipeMatchSerializer, RecipeReadSerializer,
+    ShoppingCartSerializer, TagSerializer, UserInfoSerializer,
+    UserResetPasswordSerializer, UserSignupSerializer,
     UserSubscriptionSerializer, UserTokenSerializer
 )
-from recipes.consts import ERROR_MESSAGE_DELETE_FAV_SHOPPING_CART
-from recipes.models import Ingredient, Recipe, Tag, User
+from api.utils import SHOPPING_CART_RENDERERS
+from recipes import changes
+from recipes.consts import (
+    ERROR_MESSAGE_DELETE_FAV_SHOPPING_CART, RECIPE_MATCH_MAX_RESULTS,
+    SHOPPING_CART_FILENAME
+)
+from recipes.matcher import recipe_matcher
+from recipes.models import (
+    Ingredient, Recipe, RecipeIngredient, RecipeSimilarity, Tag, User
+)
+from recipes.timeline import feed_sources
 
 
 class UserToken(UserAuthMixin):
@@ -29,7 +50,7 @@ class UserToken(UserAuthMixin):
     serializer_class = UserTokenSerializer
 
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(KeysetPaginationMixin, viewsets.ModelViewSet):
     """Вьюсет пользователя."""
 
     queryset = User.objects.all()
@@ -37,6 +58,21 @@ class UserViewSet(viewsets.ModelViewSet):
     pagination_class = GeneralPagination
     http_method_names = ['get', 'post', 'delete']
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action not in ('list', 'retrieve'):
+            return queryset
+        user = self.request.user
+        if not user.is_authenticated:
+            return queryset.annotate(is_subscribed=Value(False))
+        return queryset.annotate(
+            is_subscribed=Exists(
+                User.subscriptions.through.objects.filter(
+                    from_user=user, to_user=OuterRef('pk')
+                )
+            )
+        )
+
     def get_serializer_class(self):
         if self.action == 'create':
             return UserSignupSerializer
@@ -67,8 +103,10 @@ class UserViewSet(viewsets.ModelViewSet):
         user = self.request.user
         serializer = UserResetPasswordSerializer(user, data=request.data)
         serializer.is_valid(raise_exception=True)
-        user.set_password(serializer.validated_data['new_password'])
-        user.save()
+        user.password = passwords.make_password(
+            serializer.validated_data['new_password']
+        )
+        user.save(update_fields=('password',))
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
@@ -101,33 +139,88 @@ class UserViewSet(viewsets.ModelViewSet):
         user.subscriptions.remove(user_to_subscribe)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        url_path='subscribe',
+        url_name='subscribe_batch',
+        permission_classes=(IsAuthenticated,)
+    )
+    def subscribe_batch(self, request):
+        """Подписка/удаление подписки на нескольких пользователей."""
+        serializer = BatchIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user = self.request.user
+        return Response({'results': link_batch(
+            user.subscriptions,
+            User.objects.all(),
+            serializer.validated_data['ids'],
+            add=request.method == 'POST',
+            errors={
+                'not_found': 'Пользователь не найден.',
+                'forbidden': 'Нельзя подписаться на самого себя.',
+                'exists': 'Подписка уже существует.',
+                'missing': ('Подписки на данного '
+                            'пользователя не существует.')
+            },
+            forbidden=(user.id,)
+        )})
+
     @action(
         detail=False,
         methods=['get'],
         url_name='subscriptions',
         serializer_class=UserSubscriptionSerializer,
         pagination_class=GeneralPagination,
+        keyset_pagination_class=SubscriptionKeysetPagination,
         permission_classes=(IsAuthenticated,)
     )
     def subscriptions(self, request):
         """Получение подписок пользователя."""
-        queryset = self.request.user.subscriptions.all()
+        queryset = self.request.user.subscriptions.annotate(
+            is_subscribed=Value(True)
+        )
         page = self.paginate_queryset(queryset)
         serializer = self.get_serializer(page, many=True)
         return self.get_paginated_response(serializer.data)
 
+    @action(
+        detail=False,
+        methods=['get'],
+        url_name='feed',
+        serializer_class=RecipeReadSerializer,
+        pagination_class=FeedKeysetPagination,
+        keyset_pagination_class=None,
+        permission_classes=(IsAuthenticated,)
+    )
+    def feed(self, request):
+        """Получение рецептов авторов, на которых подписан пользователь."""
+        page = self.paginator.paginate_sources(
+            feed_sources(request.user),
+            Recipe.objects.for_read(request.user),
+            request
+        )
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
 
-class TagViewSet(viewsets.ModelViewSet):
+class TagViewSet(ConditionalGetMixin, CatalogMixin, viewsets.ModelViewSet):
     """Вьюсет тега."""
 
+    catalog = tag_catalog
+    change_keys = (changes.TAGS,)
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     http_method_names = ['get']
 
 
-class IngredientViewSet(viewsets.ModelViewSet):
+class IngredientViewSet(
+    ConditionalGetMixin, CatalogMixin, viewsets.ModelViewSet
+):
     """Вьюсет ингредиента."""
 
+    catalog = ingredient_catalog
+    change_keys = (changes.INGREDIENTS,)
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     http_method_names = ['get']
@@ -135,19 +228,49 @@ class IngredientViewSet(viewsets.ModelViewSet):
     filterset_class = IngredientFilter
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(
+    ConditionalGetMixin,
+    ResponseCacheMixin,
+    KeysetPaginationMixin,
+    viewsets.ModelViewSet
+):
     """Вьюсет рецепта."""
 
     queryset = Recipe.objects.all()
     serializer_class = RecipeCreateSerializer
     pagination_class = GeneralPagination
+    keyset_pagination_class = RecipeKeysetPagination
+    change_keys = (
+        changes.RECIPES, changes.USERS, changes.TAGS, changes.INGREDIENTS
+    )
+    user_dependent = True
+    response_cache = recipe_response_cache
+    private_query_params = ('is_favorited', 'is_in_shopping_cart')
     http_method_names = ['get', 'post', 'patch', 'delete']
     permission_classes = [IsAuthorOrReadOnly]
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
 
+    def get_queryset(self):
+        if self.action == 'retrieve':
+            return Recipe.objects.for_read(
+                self.get_response_user()
+            ).prefetch_related(
+                Prefetch(
+                    'similarities',
+                    queryset=RecipeSimilarity.objects.select_related(
+                        'similar'
+                    ).order_by('-score')
+                )
+            )
+        if self.action == 'list':
+            return Recipe.objects.for_read(self.get_response_user())
+        return super().get_queryset()
+
     def get_serializer_class(self):
-        if self.action in ('list', 'retrieve'):
+        if self.action == 'retrieve':
+            return RecipeDetailSerializer
+        if self.action == 'list':
             return RecipeReadSerializer
         return super().get_serializer_class()
 
@@ -212,6 +335,58 @@ class RecipeViewSet(viewsets.ModelViewSet):
         recipe.shopping_cart_recipes.remove(self.request.user)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    def link_recipes(self, request, manager, place):
+        """Добавляет или удаляет рецепты из тела запроса в manager."""
+        serializer = BatchIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        add = request.method == 'POST'
+        return Response({'results': link_batch(
+            manager,
+            Recipe.objects.all(),
+            serializer.validated_data['ids'],
+            add=add,
+            errors={
+                'not_found': 'Рецепт не найден.',
+                'exists': f'Рецепт уже добавлен в {place}.',
+                'missing': ERROR_MESSAGE_DELETE_FAV_SHOPPING_CART.format(
+                    place
+                )
+            },
+            # Одиночное добавление отвечает на несуществующий рецепт
+            # 400, удаление — 404.
+            not_found_status=(
+                status.HTTP_400_BAD_REQUEST if add
+                else status.HTTP_404_NOT_FOUND
+            )
+        )})
+
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        url_path='favorite',
+        url_name='favorite_batch',
+        permission_classes=(IsAuthenticated,)
+    )
+    def favorite_batch(self, request):
+        """Добавление/удаление нескольких рецептов в избранном."""
+        return self.link_recipes(
+            request, self.request.user.favorite_recipes, 'избранное'
+        )
+
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        url_path='shopping_cart',
+        url_name='shopping_cart_batch',
+        permission_classes=(IsAuthenticated,)
+    )
+    def shopping_cart_batch(self, request):
+        """Добавление/удаление нескольких рецептов в списке покупок."""
+        return self.link_recipes(
+            request, self.request.user.shopping_cart_recipes,
+            'список покупок'
+        )
+
     @action(
         detail=False,
         methods=['get'],
@@ -220,26 +395,90 @@ class RecipeViewSet(viewsets.ModelViewSet):
     )
     def download_shopping_cart(self, request):
         """Сохранение файла списка покупок."""
-        is_in_shopping_cart = Q(
-            shopping_cart_recipes__id__icontains=self.request.user.id
+        file_format = request.query_params.get('file_format', 'csv')
+        if file_format not in SHOPPING_CART_RENDERERS:
+            return Response(
+                status=status.HTTP_400_BAD_REQUEST,
+                data={'errors': ('Доступные форматы: '
+                                 f'{", ".join(SHOPPING_CART_RENDERERS)}.')}
+            )
+        content_type, renderer = SHOPPING_CART_RENDERERS[file_format]
+        shopping_cart = RecipeIngredient.objects.filter(
+            recipe__shopping_cart_recipes=self.request.user
+        ).values('ingredient').annotate(
+            name=F('ingredient__name'),
+            measurement_unit=F('ingredient__measurement_unit'),
+            amount=Sum('amount')
+        ).values('name', 'measurement_unit', 'amount').order_by('name')
+        return StreamingHttpResponse(
+            renderer(shopping_cart.iterator()),
+            content_type=content_type,
+            headers={'Content-Disposition':
+                     'attachment; '
+                     f'filename="{SHOPPING_CART_FILENAME}.{file_format}"'},
+        )
+
+    @action(
+        detail=False,
+        methods=['get'],
+        url_name='match',
+        keyset_pagination_class=None
+    )
+    def match(self, request):
+        """
+        Подбор рецептов по имеющимся продуктам: рецепты по убыванию
+        доли ингредиентов из параметров ingredients, с недостающими
+        ингредиентами.
+        """
+        query = RecipeMatchQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        ingredient_ids = query.validated_data['ingredients']
+        page = self.paginate_queryset(
+            recipe_matcher.match(ingredient_ids, RECIPE_MATCH_MAX_RESULTS)
         )
-        recipes = self.queryset.filter(is_in_shopping_cart)
-        shopping_cart = {}
-        response = HttpResponse(
-            content_type="text/csv",
-            headers={"Content-Disposition":
-                     'attachment; filename="shopping_list.csv"'},
+        recipes = Recipe.objects.prefetch_related(
+            Prefetch(
+                'ingredients',
+                queryset=RecipeIngredient.objects.exclude(
+                    ingredient_id__in=ingredient_ids
+                ).select_related('ingredient').order_by('ingredient__name'),
+                to_attr='missing_ingredients'
+            )
+        ).in_bulk([pk for pk, _, _ in page])
+        matches = []
+        for pk, matched_count, ingredients_count in page:
+            recipe = recipes.get(pk)
+            if recipe is None:
+                continue
+            recipe.matched_count = matched_count
+            recipe.ingredients_count = ingredients_count
+            recipe.coverage = round(matched_count / ingredients_count, 4)
+            matches.append(recipe)
+        serializer = RecipeMatchSerializer(
+            matches, many=True, context={'request': request}
         )
-        for recipe in recipes:
-            for ingr_rel in recipe.ingredients.all():
-                if ingr_rel.ingredient not in shopping_cart:
-                    shopping_cart[ingr_rel.ingredient] = ingr_rel.amount
-                else:
-                    shopping_cart[ingr_rel.ingredient] += ingr_rel.amount
-        writer = csv.writer(response)
-        writer.writerow(['Название', 'Единица измерения', 'Количество'])
-        writer.writerows(
-            [[ingredient.name, ingredient.measurement_unit, amount]
-             for ingredient, amount in shopping_cart.items()]
+        return self.get_paginated_response(serializer.data)
+
+
+class MetricsView(APIView):
+    """
+    Метрики API в текстовом формате Prometheus. PATCH с полем
+    sample_rate меняет долю измеряемых запросов во время работы.
+    """
+
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return HttpResponse(
+            metrics.render() + render_cache_stats(
+                'foodgram_recipe_response_cache',
+                recipe_response_cache.stats()
+            ),
+            content_type='text/plain; version=0.0.4; charset=utf-8'
         )
-        return response
+
+    def patch(self, request):
+        serializer = MetricsSettingsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        metrics.set_sample_rate(serializer.validated_data['sample_rate'])
+        return Response(serializer.data)
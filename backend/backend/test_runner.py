@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+from api.nplusone import DEFAULT_THRESHOLD
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Запуск тестов с поиском N+1: найденный повтор запросов
+    выбрасывает NPlusOneError вместо записи в журнал.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.nplusone_settings = override_settings(
+            NPLUSONE_THRESHOLD=(
+                settings.NPLUSONE_THRESHOLD or DEFAULT_THRESHOLD
+            ),
+            NPLUSONE_RAISE=True
+        )
+        self.nplusone_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.nplusone_settings.disable()
+        super().teardown_test_environment(**kwargs)
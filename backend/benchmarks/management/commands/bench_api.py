@@ -0,0 +1,141 @@
+import json
+import random
+import subprocess
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from benchmarks.runner import Bench, compare
+from benchmarks.scenarios import SCENARIOS, Context, cleanup
+from recipes.models import Ingredient, Recipe, Tag, User
+
+RESULTS_DIR = Path(settings.BASE_DIR) / 'benchmarks' / 'results'
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ('git', 'rev-parse', '--short', 'HEAD'),
+            capture_output=True, text=True, check=True,
+            cwd=settings.BASE_DIR
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = ('Замеряет задержку и число SQL-запросов конечных точек API '
+            'на данных seed_bench через WSGI-клиент в том же процессе')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument(
+            '--warmup', type=int, default=5,
+            help='Число прогонов перед замером, которые не учитываются'
+        )
+        parser.add_argument(
+            '--users-sample', type=int, default=50,
+            help='Число пользователей, от имени которых идут запросы'
+        )
+        parser.add_argument(
+            '--scenarios', nargs='+', choices=sorted(SCENARIOS),
+            default=sorted(SCENARIOS)
+        )
+        parser.add_argument('--random-seed', type=int, default=0)
+        parser.add_argument(
+            '--output',
+            help='Путь к JSON-файлу результатов '
+                 '(по умолчанию benchmarks/results/<время>.json)'
+        )
+        parser.add_argument(
+            '--compare',
+            help='JSON-файл предыдущего прогона для поиска регрессий'
+        )
+        parser.add_argument(
+            '--threshold', type=float, default=0.2,
+            help='Допустимый относительный рост p95'
+        )
+        parser.add_argument(
+            '--min-delta-ms', type=float, default=1.0,
+            help='Рост p95 меньше этого значения не считается регрессией'
+        )
+
+    def handle(self, *args, **options):
+        random.seed(options['random_seed'])
+        try:
+            context = Context(options['users_sample'])
+        except LookupError as error:
+            raise CommandError(f'{error} Сначала выполните seed_bench.')
+        scenarios = [SCENARIOS[name] for name in options['scenarios']]
+        bench = Bench()
+        started_at = timezone.now()
+        with override_settings(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']
+        ):
+            try:
+                bench.recording = False
+                for _ in range(options['warmup']):
+                    for run in scenarios:
+                        run(bench, context)
+                bench.recording = True
+                for _ in range(options['iterations']):
+                    for run in scenarios:
+                        run(bench, context)
+            finally:
+                cleanup()
+        summary = bench.summary()
+        self.report(summary)
+        output = self.save(summary, started_at, options)
+        self.stdout.write(self.style.SUCCESS(f'Результаты: {output}'))
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as file:
+                baseline = json.load(file)['results']
+            regressions = compare(
+                summary, baseline,
+                options['threshold'], options['min_delta_ms']
+            )
+            if regressions:
+                raise CommandError(
+                    'Найдены регрессии:\n' + '\n'.join(regressions)
+                )
+            self.stdout.write(self.style.SUCCESS('Регрессий нет.'))
+
+    def report(self, summary):
+        width = max(len(name) for name in summary) if summary else 0
+        self.stdout.write(
+            f'{"endpoint":<{width}} {"p50":>9} {"p95":>9} {"p99":>9} '
+            f'{"sql":>5} {"statuses"}'
+        )
+        for name, stats in summary.items():
+            self.stdout.write(
+                f'{name:<{width}} {stats["p50_ms"]:>7.2f}мс '
+                f'{stats["p95_ms"]:>7.2f}мс {stats["p99_ms"]:>7.2f}мс '
+                f'{stats["queries_max"]:>5} {stats["statuses"]}'
+            )
+
+    def save(self, summary, started_at, options):
+        output = Path(options['output']) if options['output'] else (
+            RESULTS_DIR / f'{started_at:%Y%m%dT%H%M%S}.json'
+        )
+        output.parent.mkdir(parents=True, exist_ok=True)
+        report = {
+            'started_at': started_at.isoformat(),
+            'revision': git_revision(),
+            'database': connection.vendor,
+            'iterations': options['iterations'],
+            'scenarios': options['scenarios'],
+            'data': {
+                'users': User.objects.count(),
+                'recipes': Recipe.objects.count(),
+                'ingredients': Ingredient.objects.count(),
+                'tags': Tag.objects.count(),
+            },
+            'results': summary,
+        }
+        with open(output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        return output
@@ -0,0 +1,99 @@
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import get_hasher, make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+from rest_framework.authtoken.models import Token
+
+from api import passwords
+from benchmarks.runner import percentile
+from benchmarks.seed import ADMIN_USERNAME, PASSWORD, USERNAME_PREFIX
+from recipes.models import User
+
+
+class Command(BaseCommand):
+    help = ('Замеряет пропускную способность входа по паролю '
+            '(/api/auth/token/login/) в пересчете на одно ядро')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument(
+            '--concurrency', type=int, default=8,
+            help='Число потоков, одновременно отправляющих запросы'
+        )
+        parser.add_argument(
+            '--users-sample', type=int, default=50,
+            help='Число пользователей seed_bench, от имени которых идет вход'
+        )
+
+    def handle(self, *args, **options):
+        emails = list(User.objects.filter(
+            username__startswith=USERNAME_PREFIX
+        ).exclude(username=ADMIN_USERNAME).values_list(
+            'email', flat=True
+        )[:options['users_sample']])
+        if not emails:
+            raise CommandError('Нет пользователей. Сначала выполните '
+                               'seed_bench.')
+        hasher = get_hasher()
+        # Один хеш на всех: вход не должен пересчитывать устаревшие хеши,
+        # иначе замер смешает проверку пароля с записью в базу.
+        User.objects.filter(email__in=emails).update(
+            password=make_password(PASSWORD, hasher=hasher.algorithm)
+        )
+        Token.objects.bulk_create(
+            (Token(user=user, key=Token.generate_key()) for user in
+             User.objects.filter(email__in=emails, auth_token__isnull=True)),
+            ignore_conflicts=True
+        )
+        cores = len(os.sched_getaffinity(0)) if hasattr(
+            os, 'sched_getaffinity'
+        ) else os.cpu_count()
+        with override_settings(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']
+        ):
+            self.login(emails[0])
+            cpu_started = time.process_time()
+            started = time.perf_counter()
+            with ThreadPoolExecutor(options['concurrency']) as executor:
+                results = list(executor.map(
+                    self.login,
+                    (emails[number % len(emails)]
+                     for number in range(options['requests']))
+                ))
+            elapsed = time.perf_counter() - started
+            cpu = time.process_time() - cpu_started
+        passwords.shutdown()
+        timings = sorted(timing for timing, _ in results)
+        failed = sum(status != 200 for _, status in results)
+        self.stdout.write(
+            f'Хешер: {hasher.algorithm}, процессов хеширования: '
+            f'{settings.PASSWORD_HASHING_WORKERS}, '
+            f'потоков: {options["concurrency"]}, ядер: {cores}\n'
+            f'Входов: {len(results)} (ошибок: {failed}) за {elapsed:.2f} с, '
+            f'{len(results) / elapsed:.1f} в секунду, '
+            f'{len(results) / elapsed / cores:.1f} в секунду на ядро\n'
+            f'Время ответа: p50 {percentile(timings, 50):.1f} мс, '
+            f'p95 {percentile(timings, 95):.1f} мс, '
+            f'среднее {statistics.fmean(timings):.1f} мс\n'
+            f'Процессорное время процесса запросов на вход: '
+            f'{cpu / len(results) * 1000:.1f} мс'
+        )
+
+    def login(self, email):
+        client = Client()
+        started = time.perf_counter()
+        response = client.post(
+            '/api/auth/token/login/',
+            {'email': email, 'password': PASSWORD},
+            content_type='application/json'
+        )
+        elapsed = (time.perf_counter() - started) * 1000
+        connection.close()
+        return elapsed, response.status_code
@@ -0,0 +1,130 @@
+import random
+import statistics
+import time
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+
+from api.filters import RecipeFilter
+from api.pagination import GeneralPagination
+from recipes.models import Recipe, User
+
+FILTERS = (
+    ('is_favorited', 'favorite_recipes'),
+    ('is_in_shopping_cart', 'shopping_cart_recipes'),
+)
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает скорость фильтров избранного и списка покупок '
+            'до и после перехода на подзапрос по промежуточной таблице '
+            'на временной базе данных')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=100_000)
+        parser.add_argument('--users', type=int, default=10_000)
+        parser.add_argument(
+            '--links', type=int, default=20,
+            help='Число рецептов в избранном и покупках у пользователя'
+        )
+        parser.add_argument(
+            '--samples', type=int, default=50,
+            help='Число пользователей, для которых замеряются фильтры'
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False
+        )
+        try:
+            self.seed(options)
+            users = random.sample(
+                list(User.objects.all()),
+                min(options['samples'], options['users'])
+            )
+            for key, field in FILTERS:
+                self.report(key, 'icontains', self.measure(
+                    users, lambda user: self.legacy_filter(field, user)
+                ))
+                self.report(key, 'semijoin', self.measure(
+                    users, lambda user: self.current_filter(key, user)
+                ))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def seed(self, options):
+        """Заполняет временную базу синтетическими данными."""
+        batch_size = options['batch_size']
+        started = time.perf_counter()
+        with transaction.atomic():
+            User.objects.bulk_create(
+                (User(username=f'bench{number}',
+                      email=f'bench{number}@example.com',
+                      password='!')
+                 for number in range(options['users'])),
+                batch_size=batch_size
+            )
+            user_ids = list(User.objects.values_list('id', flat=True))
+            Recipe.objects.bulk_create(
+                (Recipe(author_id=random.choice(user_ids),
+                        name=f'Рецепт {number}',
+                        text='Описание',
+                        cooking_time=random.randint(1, 120),
+                        image='recipes/images/bench.png')
+                 for number in range(options['recipes'])),
+                batch_size=batch_size
+            )
+            recipe_ids = list(Recipe.objects.values_list('id', flat=True))
+            links = min(options['links'], len(recipe_ids))
+            for _, field in FILTERS:
+                through = getattr(Recipe, field).through
+                through.objects.bulk_create(
+                    (through(user_id=user_id, recipe_id=recipe_id)
+                     for user_id in user_ids
+                     for recipe_id in random.sample(recipe_ids, links)),
+                    batch_size=batch_size
+                )
+        self.stdout.write(
+            f'Данные созданы за {time.perf_counter() - started:.1f} с'
+        )
+
+    def legacy_filter(self, field, user):
+        """Прежний фильтр через LIKE по приведенному к строке id."""
+        return Recipe.objects.filter(
+            Q(**{f'{field}__id__icontains': user.id})
+        )
+
+    def current_filter(self, key, user):
+        """Текущий фильтр RecipeFilter."""
+        return RecipeFilter(
+            data={key: 'true'},
+            queryset=Recipe.objects.all(),
+            request=SimpleNamespace(user=user)
+        ).qs
+
+    def measure(self, users, build_queryset):
+        """Замеряет подсчет и выборку первой страницы для каждого."""
+        timings = []
+        rows = []
+        for user in users:
+            queryset = build_queryset(user)
+            started = time.perf_counter()
+            rows.append(queryset.count())
+            list(queryset[:GeneralPagination.page_size])
+            timings.append((time.perf_counter() - started) * 1000)
+        return timings, rows
+
+    def report(self, key, variant, result):
+        timings, rows = result
+        timings.sort()
+        p95 = timings[int(len(timings) * 0.95) - 1] if timings else 0
+        self.stdout.write(
+            f'{key:<20} {variant:<10} '
+            f'median={statistics.median(timings):8.2f} мс '
+            f'p95={p95:8.2f} мс '
+            f'rows={statistics.mean(rows):8.1f}'
+        )
@@ -0,0 +1,70 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from benchmarks.seed import ADMIN_USERNAME, PASSWORD, Seeder
+
+
+class Command(BaseCommand):
+    help = ('Заполняет базу данных синтетическими пользователями, '
+            'рецептами, избранным, списками покупок и подписками '
+            'для нагрузочного тестирования')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10_000)
+        parser.add_argument(
+            '--ingredients', type=int, default=2000,
+            help='Число ингредиентов, если их нет в базе'
+        )
+        parser.add_argument(
+            '--tags', type=int, default=8,
+            help='Число тегов, если их нет в базе'
+        )
+        parser.add_argument(
+            '--ingredients-per-recipe', type=int, default=8,
+            help='Среднее число ингредиентов в рецепте'
+        )
+        parser.add_argument(
+            '--tags-per-recipe', type=int, default=3,
+            help='Наибольшее число тегов у рецепта'
+        )
+        parser.add_argument(
+            '--favorites', type=int, default=20,
+            help='Среднее число рецептов в избранном у пользователя'
+        )
+        parser.add_argument(
+            '--cart', type=int, default=5,
+            help='Среднее число рецептов в списке покупок у пользователя'
+        )
+        parser.add_argument(
+            '--subscriptions', type=int, default=10,
+            help='Среднее число подписок у пользователя'
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--random-seed', type=int, default=0)
+        parser.add_argument(
+            '--allow-production', action='store_true',
+            help=('Заполнить базу при выключенном DEBUG. Созданные '
+                  'пользователи получают общий известный пароль')
+        )
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options['allow_production']:
+            raise CommandError(
+                'DEBUG выключен: похоже, это рабочая база. Запустите '
+                'команду с --allow-production, если это не так.'
+            )
+        started = time.perf_counter()
+        seeder = Seeder(options, self.stdout)
+        seeder.run()
+        self.stdout.write(self.style.SUCCESS(
+            f'Данные созданы за {time.perf_counter() - started:.1f} с. '
+            f'Пароль пользователей: {PASSWORD}'
+        ))
+        if seeder.admin_password is not None:
+            self.stdout.write(
+                f'Пароль администратора {ADMIN_USERNAME}: '
+                f'{seeder.admin_password}. Он больше не будет показан.'
+            )
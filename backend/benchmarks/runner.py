@@ -0,0 +1,96 @@
+import json
+import math
+import statistics
+import time
+from collections import defaultdict
+
+from django.db import connection
+
+from api.metrics import QueryRecorder
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(values, rank):
+    """Процентиль по методу ближайшего ранга для отсортированных values."""
+    if not values:
+        return 0.0
+    return values[max(math.ceil(rank / 100 * len(values)) - 1, 0)]
+
+
+class Bench:
+    """
+    Выполняет запросы через тестовый WSGI-клиент Django и копит
+    для каждой конечной точки время ответа, число SQL-запросов
+    и коды ответов.
+    """
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.recording = True
+
+    def request(self, name, client, method, path, data=None):
+        kwargs = {}
+        if data is not None:
+            kwargs = {'data': json.dumps(data),
+                      'content_type': 'application/json'}
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with connection.execute_wrapper(recorder):
+            response = getattr(client, method)(path, **kwargs)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        elapsed = (time.perf_counter() - started) * 1000
+        if self.recording:
+            self.samples[name].append(
+                (elapsed, recorder.count, response.status_code)
+            )
+        return response
+
+    def summary(self):
+        """Сводка по конечным точкам: процентили, запросы, ошибки."""
+        result = {}
+        for name, samples in sorted(self.samples.items()):
+            timings = sorted(sample[0] for sample in samples)
+            queries = [sample[1] for sample in samples]
+            statuses = defaultdict(int)
+            for sample in samples:
+                statuses[str(sample[2])] += 1
+            result[name] = {
+                'count': len(samples),
+                **{
+                    f'p{rank}_ms': round(percentile(timings, rank), 3)
+                    for rank in PERCENTILES
+                },
+                'mean_ms': round(statistics.fmean(timings), 3),
+                'max_ms': round(timings[-1], 3),
+                'queries_median': statistics.median(queries),
+                'queries_max': max(queries),
+                'statuses': dict(statuses),
+            }
+        return result
+
+
+def compare(current, baseline, threshold, min_delta_ms):
+    """
+    Сравнивает сводки двух прогонов и возвращает список регрессий:
+    рост p95 больше чем на долю threshold (и не меньше min_delta_ms)
+    или рост наибольшего числа SQL-запросов.
+    """
+    regressions = []
+    for name, stats in current.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        delta = stats['p95_ms'] - base['p95_ms']
+        if delta > base['p95_ms'] * threshold and delta >= min_delta_ms:
+            regressions.append(
+                f'{name}: p95 {base["p95_ms"]:.2f} -> '
+                f'{stats["p95_ms"]:.2f} мс'
+            )
+        if stats['queries_max'] > base['queries_max']:
+            regressions.append(
+                f'{name}: SQL-запросов {base["queries_max"]} -> '
+                f'{stats["queries_max"]}'
+            )
+    return regressions
@@ -0,0 +1,218 @@
+import base64
+import random
+import uuid
+from io import BytesIO
+
+from django.test import Client
+from PIL import Image
+from rest_framework.authtoken.models import Token
+
+from benchmarks.seed import ADMIN_USERNAME, PASSWORD, USERNAME_PREFIX
+from recipes.models import Ingredient, Recipe, Tag, User
+
+SIGNUP_PREFIX = f'{USERNAME_PREFIX}signup'
+
+SCENARIOS = {}
+
+
+def scenario(function):
+    """Регистрирует сценарий нагрузочного теста по имени функции."""
+    SCENARIOS[function.__name__] = function
+    return function
+
+
+def token_client(user):
+    token, _ = Token.objects.get_or_create(user=user)
+    return Client(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+
+class Context:
+    """Клиенты и идентификаторы синтетических данных для сценариев."""
+
+    def __init__(self, users_sample):
+        users = list(User.objects.filter(
+            username__startswith=USERNAME_PREFIX
+        ).exclude(username=ADMIN_USERNAME).exclude(
+            username__startswith=SIGNUP_PREFIX
+        ).order_by('?')[:users_sample])
+        if not users:
+            raise LookupError('Нет пользователей seed_bench.')
+        self.anon = Client()
+        self.clients = [(user, token_client(user)) for user in users]
+        self.admin = token_client(User.objects.get(username=ADMIN_USERNAME))
+        self.user_ids = list(User.objects.values_list('id', flat=True))
+        self.recipe_ids = list(Recipe.objects.values_list('id', flat=True))
+        self.tags = list(Tag.objects.values_list('id', 'slug'))
+        self.ingredients = list(Ingredient.objects.values_list('id', 'name'))
+        buffer = BytesIO()
+        Image.new('RGB', (64, 64), (73, 182, 78)).save(buffer, 'PNG')
+        self.image = 'data:image/png;base64,' + base64.b64encode(
+            buffer.getvalue()
+        ).decode()
+
+    def user(self):
+        return random.choice(self.clients)
+
+    def recipe_body(self):
+        return {
+            'name': 'Рецепт нагрузочного теста',
+            'text': 'Описание',
+            'cooking_time': random.randint(5, 120),
+            'image': self.image,
+            'tags': [
+                tag_id for tag_id, _ in random.sample(
+                    self.tags, min(2, len(self.tags))
+                )
+            ],
+            'ingredients': [
+                {'id': ingredient_id, 'amount': random.randint(1, 500)}
+                for ingredient_id, _ in random.sample(
+                    self.ingredients, min(5, len(self.ingredients))
+                )
+            ],
+        }
+
+
+def toggle(bench, name, client, path, exists):
+    """Добавляет и удаляет связь, возвращая данные в исходное состояние."""
+    order = ('delete', 'post') if exists else ('post', 'delete')
+    for method in order:
+        bench.request(f'{method.upper()} {name}', client, method, path,
+                      {} if method == 'post' else None)
+
+
+@scenario
+def users(bench, context):
+    user, client = context.user()
+    bench.request('GET /api/users/', context.anon, 'get',
+                  f'/api/users/?page={random.randint(1, 5)}')
+    bench.request('GET /api/users/{id}/', client, 'get',
+                  f'/api/users/{random.choice(context.user_ids)}/')
+    bench.request('GET /api/users/me/', client, 'get', '/api/users/me/')
+    bench.request('POST /api/users/set_password/', client, 'post',
+                  '/api/users/set_password/',
+                  {'current_password': PASSWORD, 'new_password': PASSWORD})
+    bench.request('POST /api/users/', context.anon, 'post', '/api/users/', {
+        'email': f'{SIGNUP_PREFIX}{uuid.uuid4().hex}@example.com',
+        'username': f'{SIGNUP_PREFIX}{uuid.uuid4().hex[:16]}',
+        'first_name': 'Имя',
+        'last_name': 'Фамилия',
+        'password': PASSWORD,
+    })
+    bench.request('POST /api/auth/token/login/', context.anon, 'post',
+                  '/api/auth/token/login/',
+                  {'email': user.email, 'password': PASSWORD})
+
+
+@scenario
+def subscriptions(bench, context):
+    user, client = context.user()
+    bench.request('GET /api/users/subscriptions/', client, 'get',
+                  '/api/users/subscriptions/?recipes_limit=3')
+    bench.request('GET /api/users/subscriptions/?cursor=', client, 'get',
+                  '/api/users/subscriptions/?cursor=&recipes_limit=3')
+    bench.request('GET /api/users/feed/', client, 'get', '/api/users/feed/')
+    author_id = random.choice(context.user_ids)
+    if author_id == user.id:
+        return
+    toggle(
+        bench, '/api/users/{id}/subscribe/', client,
+        f'/api/users/{author_id}/subscribe/',
+        user.subscriptions.filter(id=author_id).exists()
+    )
+
+
+@scenario
+def catalogs(bench, context):
+    tag_id, _ = random.choice(context.tags)
+    ingredient_id, name = random.choice(context.ingredients)
+    bench.request('GET /api/tags/', context.anon, 'get', '/api/tags/')
+    bench.request('GET /api/tags/{id}/', context.anon, 'get',
+                  f'/api/tags/{tag_id}/')
+    bench.request('GET /api/ingredients/', context.anon, 'get',
+                  '/api/ingredients/')
+    bench.request('GET /api/ingredients/?name=', context.anon, 'get',
+                  f'/api/ingredients/?name={name[:3]}')
+    bench.request('GET /api/ingredients/{id}/', context.anon, 'get',
+                  f'/api/ingredients/{ingredient_id}/')
+
+
+@scenario
+def recipes(bench, context):
+    user, client = context.user()
+    page = random.randint(1, 10)
+    _, slug = random.choice(context.tags)
+    bench.request('GET /api/recipes/ (anonymous)', context.anon, 'get',
+                  f'/api/recipes/?page={page}')
+    bench.request('GET /api/recipes/', client, 'get',
+                  f'/api/recipes/?page={page}')
+    bench.request('GET /api/recipes/?tags=', client, 'get',
+                  f'/api/recipes/?tags={slug}')
+    bench.request('GET /api/recipes/?author=', client, 'get',
+                  f'/api/recipes/?author={random.choice(context.user_ids)}')
+    bench.request('GET /api/recipes/?is_favorited=1', client, 'get',
+                  '/api/recipes/?is_favorited=1')
+    bench.request('GET /api/recipes/?is_in_shopping_cart=1', client, 'get',
+                  '/api/recipes/?is_in_shopping_cart=1')
+    bench.request('GET /api/recipes/?cursor=', client, 'get',
+                  '/api/recipes/?cursor=')
+    _, ingredient = random.choice(context.ingredients)
+    bench.request('GET /api/recipes/?search=', client, 'get',
+                  f'/api/recipes/?search={ingredient}')
+    bench.request('GET /api/recipes/{id}/', client, 'get',
+                  f'/api/recipes/{random.choice(context.recipe_ids)}/')
+    pantry = '&'.join(
+        f'ingredients={ingredient_id}' for ingredient_id, _ in random.sample(
+            context.ingredients, min(15, len(context.ingredients))
+        )
+    )
+    bench.request('GET /api/recipes/match/', client, 'get',
+                  f'/api/recipes/match/?{pantry}')
+
+
+@scenario
+def recipe_lifecycle(bench, context):
+    _, client = context.user()
+    response = bench.request('POST /api/recipes/', client, 'post',
+                             '/api/recipes/', context.recipe_body())
+    if response.status_code != 201:
+        return
+    path = f'/api/recipes/{response.json()["id"]}/'
+    bench.request('PATCH /api/recipes/{id}/', client, 'patch', path,
+                  context.recipe_body())
+    bench.request('DELETE /api/recipes/{id}/', client, 'delete', path)
+
+
+@scenario
+def recipe_links(bench, context):
+    user, client = context.user()
+    recipe_id = random.choice(context.recipe_ids)
+    toggle(
+        bench, '/api/recipes/{id}/favorite/', client,
+        f'/api/recipes/{recipe_id}/favorite/',
+        Recipe.favorite_recipes.through.objects.filter(
+            user=user, recipe_id=recipe_id
+        ).exists()
+    )
+    toggle(
+        bench, '/api/recipes/{id}/shopping_cart/', client,
+        f'/api/recipes/{recipe_id}/shopping_cart/',
+        Recipe.shopping_cart_recipes.through.objects.filter(
+            user=user, recipe_id=recipe_id
+        ).exists()
+    )
+    bench.request('GET /api/recipes/download_shopping_cart/', client, 'get',
+                  '/api/recipes/download_shopping_cart/')
+    bench.request('GET /api/recipes/download_shopping_cart/?file_format=txt',
+                  client, 'get',
+                  '/api/recipes/download_shopping_cart/?file_format=txt')
+
+
+@scenario
+def metrics(bench, context):
+    bench.request('GET /api/metrics/', context.admin, 'get', '/api/metrics/')
+
+
+def cleanup():
+    """Удаляет пользователей, зарегистрированных сценариями."""
+    User.objects.filter(username__startswith=SIGNUP_PREFIX).delete()
@@ -0,0 +1,233 @@
+import random
+import secrets
+from io import BytesIO
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+from PIL import Image
+
+from api.catalog import ingredient_catalog, tag_catalog
+from recipes import changes
+from recipes.counters import recount
+from recipes.matcher import recipe_matcher
+from recipes.models import (
+    Ingredient, Recipe, RecipeIngredient, RecipeTag, StoredFile, Tag, User
+)
+from recipes.search import (
+    ingredient_index, recipe_index, update_search_vectors
+)
+from recipes.timeline import fan_out_pending
+
+USERNAME_PREFIX = 'bench'
+PASSWORD = 'bench-password'
+ADMIN_USERNAME = 'bench_admin'
+MEASUREMENT_UNITS = ('г', 'кг', 'мл', 'л', 'шт.', 'ст. л.', 'ч. л.')
+
+
+def zipf_weights(size, exponent=1.1):
+    """
+    Накопленные веса популярности: объект с рангом k выбирается
+    пропорционально 1 / k ** exponent, как авторы и рецепты
+    в реальных соцсетях.
+    """
+    return list(accumulate(
+        1 / rank ** exponent for rank in range(1, size + 1)
+    ))
+
+
+def sample_popular(population, cum_weights, count):
+    """Выбирает до count разных объектов с учетом популярности."""
+    count = min(count, len(population))
+    chosen = set()
+    while len(chosen) < count:
+        chosen.update(random.choices(
+            population, cum_weights=cum_weights, k=count - len(chosen)
+        ))
+    return chosen
+
+
+def placeholder_image():
+    """Сохраняет в хранилище изображение для синтетических рецептов."""
+    buffer = BytesIO()
+    Image.new('RGB', (640, 480), (226, 108, 45)).save(buffer, 'PNG')
+    return default_storage.save(
+        'recipes/images/bench.png', ContentFile(buffer.getvalue())
+    )
+
+
+class Seeder:
+    """Заполняет базу синтетическими данными для нагрузочных тестов."""
+
+    def __init__(self, options, stdout):
+        self.options = options
+        self.stdout = stdout
+        self.batch_size = options['batch_size']
+        self.admin_password = None
+
+    def run(self):
+        random.seed(self.options['random_seed'])
+        with transaction.atomic():
+            tag_ids = self.seed_tags()
+            ingredient_ids = self.seed_ingredients()
+            user_ids = self.seed_users()
+            recipe_ids = self.seed_recipes(user_ids, tag_ids, ingredient_ids)
+            self.seed_links(user_ids, recipe_ids)
+            self.seed_subscriptions(user_ids)
+            recount(Recipe, User)
+            update_search_vectors(recipe_ids)
+            _, written = fan_out_pending(self.batch_size)
+            self.log(f'Ленты подписок заполнены: {written} записей')
+        changes.bump(
+            changes.RECIPES, changes.USERS, changes.TAGS, changes.INGREDIENTS
+        )
+        ingredient_index.invalidate()
+        recipe_index.invalidate()
+        recipe_matcher.invalidate()
+        ingredient_catalog.invalidate()
+        tag_catalog.invalidate()
+
+    def log(self, message):
+        self.stdout.write(message)
+
+    def seed_tags(self):
+        existing = list(Tag.objects.values_list('id', flat=True))
+        if existing:
+            return existing
+        Tag.objects.bulk_create(
+            Tag(name=f'Тег {number}', slug=f'bench-tag-{number}',
+                color=f'#{number * 0x1F3A7 % 0x1000000:06X}')
+            for number in range(self.options['tags'])
+        )
+        self.log(f'Тегов создано: {self.options["tags"]}')
+        return list(Tag.objects.values_list('id', flat=True))
+
+    def seed_ingredients(self):
+        existing = list(Ingredient.objects.values_list('id', flat=True))
+        if existing:
+            return existing
+        Ingredient.objects.bulk_create(
+            (Ingredient(
+                name=f'ингредиент {number}',
+                measurement_unit=random.choice(MEASUREMENT_UNITS)
+            ) for number in range(self.options['ingredients'])),
+            batch_size=self.batch_size
+        )
+        self.log(f'Ингредиентов создано: {self.options["ingredients"]}')
+        return list(Ingredient.objects.values_list('id', flat=True))
+
+    def seed_users(self):
+        password = make_password(PASSWORD)
+        start = User.objects.filter(
+            username__startswith=USERNAME_PREFIX
+        ).count()
+        User.objects.bulk_create(
+            (User(username=f'{USERNAME_PREFIX}{number}',
+                  email=f'{USERNAME_PREFIX}{number}@example.com',
+                  first_name='Имя', last_name='Фамилия',
+                  password=password)
+             for number in range(start, start + self.options['users'])),
+            batch_size=self.batch_size
+        )
+        if not User.objects.filter(username=ADMIN_USERNAME).exists():
+            self.admin_password = secrets.token_urlsafe(16)
+            User.objects.create(
+                username=ADMIN_USERNAME,
+                email=f'{ADMIN_USERNAME}@example.com',
+                password=make_password(self.admin_password),
+                is_staff=True
+            )
+        self.log(f'Пользователей создано: {self.options["users"]}')
+        return list(User.objects.filter(
+            username__startswith=USERNAME_PREFIX
+        ).exclude(username=ADMIN_USERNAME).values_list('id', flat=True))
+
+    def seed_recipes(self, user_ids, tag_ids, ingredient_ids):
+        image = placeholder_image()
+        count = self.options['recipes']
+        authors = zipf_weights(len(user_ids))
+        Recipe.objects.bulk_create(
+            (Recipe(author_id=random.choices(user_ids, cum_weights=authors)[0],
+                    name=f'Рецепт {number}',
+                    text='Описание синтетического рецепта.',
+                    cooking_time=random.randint(5, 180),
+                    image=image)
+             for number in range(count)),
+            batch_size=self.batch_size
+        )
+        recipe_ids = list(
+            Recipe.objects.order_by('-id').values_list('id', flat=True)[:count]
+        )
+        StoredFile.objects.bulk_create(
+            [StoredFile(name=image)], ignore_conflicts=True
+        )
+        StoredFile.objects.filter(name=image).update(
+            references=F('references') + count
+        )
+        fan_out = self.options['ingredients_per_recipe']
+        RecipeIngredient.objects.bulk_create(
+            (RecipeIngredient(recipe_id=recipe_id, ingredient_id=ingredient_id,
+                              amount=random.randint(1, 500))
+             for recipe_id in recipe_ids
+             for ingredient_id in random.sample(
+                 ingredient_ids,
+                 min(len(ingredient_ids),
+                     max(1, int(random.gauss(fan_out, fan_out / 3))))
+             )),
+            batch_size=self.batch_size
+        )
+        RecipeTag.objects.bulk_create(
+            (RecipeTag(recipe_id=recipe_id, tag_id=tag_id)
+             for recipe_id in recipe_ids
+             for tag_id in random.sample(
+                 tag_ids,
+                 random.randint(
+                     1, min(len(tag_ids), self.options['tags_per_recipe'])
+                 )
+             )),
+            batch_size=self.batch_size
+        )
+        self.log(f'Рецептов создано: {count}')
+        return recipe_ids
+
+    def seed_links(self, user_ids, recipe_ids):
+        popularity = zipf_weights(len(recipe_ids))
+        for field, option in (
+            ('favorite_recipes', 'favorites'),
+            ('shopping_cart_recipes', 'cart'),
+        ):
+            through = getattr(Recipe, field).through
+            through.objects.bulk_create(
+                (through(user_id=user_id, recipe_id=recipe_id)
+                 for user_id in user_ids
+                 for recipe_id in sample_popular(
+                     recipe_ids, popularity,
+                     random.randint(0, 2 * self.options[option])
+                 )),
+                batch_size=self.batch_size,
+                ignore_conflicts=True
+            )
+        self.log('Избранное и списки покупок заполнены')
+
+    def seed_subscriptions(self, user_ids):
+        through = User.subscriptions.through
+        popularity = zipf_weights(len(user_ids))
+        links = set()
+        for user_id in user_ids:
+            for author_id in sample_popular(
+                user_ids, popularity,
+                random.randint(0, 2 * self.options['subscriptions'])
+            ):
+                if author_id != user_id:
+                    links.add((user_id, author_id))
+                    links.add((author_id, user_id))
+        through.objects.bulk_create(
+            (through(from_user_id=from_id, to_user_id=to_id)
+             for from_id, to_id in links),
+            batch_size=self.batch_size,
+            ignore_conflicts=True
+        )
+        self.log(f'Подписок создано: {len(links) // 2}')
@@ -0,0 +1,75 @@
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from recipes.models import ChangeCounter
+
+RECIPES = 'recipes'
+USERS = 'users'
+TAGS = 'tags'
+INGREDIENTS = 'ingredients'
+
+
+def user_key(user_id):
+    """Ключ счетчика изменений данных, видимых только пользователю."""
+    return f'user:{user_id}'
+
+
+class Bump:
+    """Отложенное до фиксации транзакции увеличение счетчиков."""
+
+    def __init__(self, keys):
+        self.keys = frozenset(keys)
+
+    def __call__(self):
+        updated = ChangeCounter.objects.filter(key__in=self.keys).update(
+            version=F('version') + 1,
+            modified=timezone.now()
+        )
+        if updated < len(self.keys):
+            ChangeCounter.objects.bulk_create(
+                [ChangeCounter(key=key, version=1) for key in self.keys],
+                ignore_conflicts=True
+            )
+
+
+def bump(*keys):
+    """
+    Увеличивает счетчики изменений после фиксации транзакции.
+
+    Повторный вызов в той же транзакции, например из сигналов
+    каскадно удаляемых ингредиентов рецепта, ничего не добавляет,
+    если те же счетчики уже будут увеличены при фиксации: отложенное
+    увеличение зарегистрировано в той же или внешней точке сохранения
+    и не может быть отменено без отмены текущей.
+    """
+    keys = frozenset(keys)
+    connection = transaction.get_connection()
+    if connection.in_atomic_block:
+        savepoints = set(connection.savepoint_ids)
+        for registered, callback, *_ in connection.run_on_commit:
+            if (
+                isinstance(callback, Bump)
+                and keys <= callback.keys
+                and set(registered) <= savepoints
+            ):
+                return
+    transaction.on_commit(Bump(keys))
+
+
+def read(keys):
+    """
+    Возвращает версии счетчиков в порядке keys и время
+    последнего изменения среди них.
+    """
+    counters = {
+        key: (version, modified)
+        for key, version, modified in ChangeCounter.objects.filter(
+            key__in=keys
+        ).values_list('key', 'version', 'modified')
+    }
+    versions = [counters.get(key, (0, None))[0] for key in keys]
+    modified = [
+        counters[key][1] for key in keys if key in counters
+    ]
+    return versions, max(modified) if modified else None
@@ -8,6 +8,8 @@ MAX_LEN_PASSWORD = 150
 
 MAX_LEN_RECIPE_NAME = 200
 
+MAX_LEN_STORED_FILE_NAME = 255
+
 ERROR_MESSAGE_SIGNUP = ('Поле {} не соответствует '
                         'пользователю с данным {}.')
 
@@ -21,3 +23,64 @@ MAX_VALUE_AMOUNT = 32000
 MIN_VALUE_COOKING_TIME = 1
 
 MAX_VALUE_COOKING_TIME = 32000
+
+SHOPPING_CART_FILENAME = 'shopping_list'
+
+SHOPPING_CART_HEADER = ('Название', 'Единица измерения', 'Количество')
+
+INGREDIENT_INDEX_TTL = 300
+
+INGREDIENT_SEARCH_MAX_RESULTS = 100
+
+RECIPE_IMAGE_RENDITIONS = {
+    'thumbnail': 480,
+    'detail': 1280,
+}
+
+RECIPE_IMAGE_QUALITY = 82
+
+RECIPE_INDEX_TTL = 600
+
+RECIPE_SEARCH_MAX_RESULTS = 300
+
+RECIPE_SEARCH_WEIGHTS = {
+    'name': 3,
+    'ingredients': 2,
+    'text': 1,
+}
+
+RECIPE_SEARCH_CONFIG = 'russian'
+
+BM25_K1 = 1.2
+
+BM25_B = 0.75
+
+SEARCH_STOP_WORDS = frozenset((
+    'а', 'без', 'в', 'во', 'для', 'до', 'же', 'за', 'и', 'из', 'или',
+    'к', 'как', 'ко', 'на', 'не', 'о', 'об', 'от', 'по', 'под', 'при',
+    'с', 'со', 'у', 'это',
+))
+
+RECIPE_MATCH_MAX_RESULTS = 300
+
+RECIPE_MATCH_MAX_INGREDIENTS = 200
+
+SIMILAR_RECIPES_TOP_K = 10
+
+SIMILAR_RECIPES_WEIGHTS = {
+    'ingredients': 1.0,
+    'tags': 0.5,
+    'favorites': 0.7,
+}
+
+SIMILAR_RECIPES_MAX_POSTINGS = 1000
+
+SIMILAR_RECIPES_RESCORE = 5
+
+TIMELINE_FANOUT_BATCH_SIZE = 1000
+
+TIMELINE_FANOUT_MAX_SUBSCRIBERS = 5000
+
+TIMELINE_BACKFILL_RECIPES = 100
+
+BATCH_MAX_IDS = 100
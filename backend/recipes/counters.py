@@ -0,0 +1,32 @@
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_subquery(queryset, field):
+    """Подзапрос числа записей queryset, ссылающихся на внешний объект."""
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{field: OuterRef('pk')}).order_by().values(
+                field
+            ).annotate(total=Count('*')).values('total')
+        ),
+        0
+    )
+
+
+def recount(recipe_model, user_model):
+    """Пересчитывает счетчики рецептов и пользователей целиком."""
+    recipe_model.objects.update(
+        favorites_count=count_subquery(
+            recipe_model.favorite_recipes.through.objects, 'recipe'
+        ),
+        shopping_cart_count=count_subquery(
+            recipe_model.shopping_cart_recipes.through.objects, 'recipe'
+        )
+    )
+    user_model.objects.update(
+        recipes_count=count_subquery(recipe_model.objects, 'author'),
+        subscribers_count=count_subquery(
+            user_model.subscriptions.through.objects, 'to_user'
+        )
+    )
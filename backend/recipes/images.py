@@ -0,0 +1,109 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from PIL import Image, ImageOps, features
+
+from recipes import changes
+from recipes.consts import RECIPE_IMAGE_QUALITY, RECIPE_IMAGE_RENDITIONS
+from recipes.storage import release, retain
+
+logger = logging.getLogger(__name__)
+
+RENDITIONS_DIR = 'recipes/images/renditions/'
+
+executor = (
+    ThreadPoolExecutor(
+        settings.RECIPE_IMAGE_WORKERS, thread_name_prefix='recipe-images'
+    )
+    if settings.RECIPE_IMAGE_WORKERS > 0 else None
+)
+
+
+def rendition_format():
+    """WebP, если Pillow собран с его поддержкой, иначе JPEG."""
+    return 'WEBP' if features.check('webp') else 'JPEG'
+
+
+def render(image, size, image_format):
+    """Возвращает байты копии изображения, вписанной в квадрат size."""
+    copy = image.copy()
+    copy.thumbnail((size, size), Image.LANCZOS)
+    if image_format == 'JPEG' and copy.mode not in ('RGB', 'L'):
+        copy = copy.convert('RGB')
+    buffer = BytesIO()
+    copy.save(buffer, image_format, quality=RECIPE_IMAGE_QUALITY)
+    return buffer.getvalue()
+
+
+def make_renditions(recipe_id, name):
+    """
+    Строит уменьшенные копии изображения рецепта и сохраняет их
+    имена в image_renditions, если изображение за это время
+    не сменилось.
+    """
+    from recipes.models import Recipe
+
+    storage = Recipe._meta.get_field('image').storage
+    image_format = rendition_format()
+    stem = os.path.splitext(os.path.basename(name))[0]
+    saved = {}
+    try:
+        with storage.open(name) as file:
+            image = ImageOps.exif_transpose(Image.open(file))
+            image.load()
+        for rendition, size in RECIPE_IMAGE_RENDITIONS.items():
+            saved[rendition] = storage.save(
+                f'{RENDITIONS_DIR}{stem}_{rendition}.'
+                f'{image_format.lower()}',
+                ContentFile(render(image, size, image_format))
+            )
+        recipes = Recipe.objects.filter(pk=recipe_id, image=name)
+        previous = recipes.values_list('image_renditions', flat=True).first()
+        retain(set(saved.values()))
+        if recipes.update(image_renditions={'source': name, **saved}):
+            release({
+                path for rendition, path in (previous or {}).items()
+                if rendition != 'source'
+            })
+            changes.bump(changes.RECIPES)
+        else:
+            release(set(saved.values()))
+    except Exception:
+        logger.exception(
+            'Не удалось построить копии изображения %s рецепта %s',
+            name, recipe_id
+        )
+
+
+def make_renditions_in_pool(recipe_id, name):
+    """Задача пула: закрывает соединение с базой своего потока."""
+    try:
+        make_renditions(recipe_id, name)
+    finally:
+        connection.close()
+
+
+def schedule_renditions(recipe):
+    """
+    Ставит построение копий изображения в очередь фонового пула
+    после фиксации транзакции. Без пула копии строятся сразу.
+    """
+    name = recipe.image.name
+    if executor is None:
+        transaction.on_commit(lambda: make_renditions(recipe.pk, name))
+        return
+    transaction.on_commit(
+        lambda: executor.submit(make_renditions_in_pool, recipe.pk, name)
+    )
+
+
+def renditions_outdated(recipe):
+    """Проверяет, построены ли копии для текущего изображения рецепта."""
+    return bool(recipe.image) and (
+        recipe.image_renditions.get('source') != recipe.image.name
+    )
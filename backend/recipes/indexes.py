@@ -0,0 +1,105 @@
+import time
+from threading import Lock
+
+
+class LazyIndex:
+    """
+    Индекс в памяти процесса, который строится при первом обращении
+    и перестраивается по истечении ttl, чтобы изменения из других
+    процессов тоже были видны.
+
+    Все данные индекса — один объект состояния: load() строит новое
+    состояние, сброс и перестроение заменяют ссылку на него целиком.
+    Перестраивает индекс только один поток; остальные на это время
+    читают прежнее состояние, а если его еще нет — ждут построения.
+    Подклассы с обновлением по записям реализуют fetch(), empty(),
+    add() и discard(): тогда update() и remove() меняют состояние
+    на месте под блокировкой, под которой его читают и подклассы.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = Lock()
+        self._build_lock = Lock()
+        self._state = None
+        self._built_at = 0
+
+    def invalidate(self):
+        """Сбрасывает индекс, он будет перестроен при следующем чтении."""
+        with self._lock:
+            self._state = None
+
+    def expired(self, state):
+        return (
+            state is None or time.monotonic() - self._built_at > self.ttl
+        )
+
+    def fetch(self, ids=None):
+        """Возвращает словарь {id: данные записи} для записей ids."""
+        raise NotImplementedError
+
+    def empty(self):
+        """Возвращает пустое состояние индекса."""
+        raise NotImplementedError
+
+    def add(self, state, pk, value):
+        raise NotImplementedError
+
+    def discard(self, state, pk):
+        raise NotImplementedError
+
+    def load(self):
+        """Строит состояние по текущему содержимому базы."""
+        state = self.empty()
+        for pk, value in self.fetch().items():
+            self.add(state, pk, value)
+        return state
+
+    def build(self):
+        state = self.load()
+        with self._lock:
+            self._state = state
+            self._built_at = time.monotonic()
+        return state
+
+    def snapshot(self):
+        """Возвращает текущее состояние, при необходимости перестроив его."""
+        state = self._state
+        if not self.expired(state):
+            return state
+        if not self._build_lock.acquire(blocking=state is None):
+            # Индекс уже перестраивает другой поток.
+            return state
+        try:
+            state = self._state
+            if self.expired(state):
+                state = self.build()
+            return state
+        finally:
+            self._build_lock.release()
+
+    def update(self, ids):
+        """
+        Перечитывает записи ids, удаленные из базы убирает.
+        Непостроенный индекс не трогает: он и так прочитает
+        свежие данные при построении.
+        """
+        if self._state is None:
+            return
+        values = self.fetch(ids)
+        with self._lock:
+            state = self._state
+            if state is None:
+                return
+            for pk in ids:
+                self.discard(state, pk)
+                if pk in values:
+                    self.add(state, pk, values[pk])
+
+    def remove(self, ids):
+        """Убирает записи из индекса."""
+        with self._lock:
+            state = self._state
+            if state is not None:
+                for pk in ids:
+                    self.discard(state, pk)
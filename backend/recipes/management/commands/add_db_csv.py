@@ -1,26 +1,179 @@
 import csv
-from django.core.management.base import BaseCommand
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.catalog import ingredient_catalog, tag_catalog
+from recipes import changes
 from recipes.models import Ingredient, Tag
+from recipes.search import ingredient_index
 
 DATA_SOURCES_FOR_MOVIE_DATABASE = [
-    (Ingredient, '../data/ingredients.csv', ['name', 'measurement_unit']),
-    (Tag, '../data/tags.csv', ['name', 'color', 'slug']),
+    (Ingredient, '../data/ingredients.csv', ['name', 'measurement_unit'],
+     ['name', 'measurement_unit']),
+    (Ingredient, '../data/ingredients.json', ['name', 'measurement_unit'],
+     ['name', 'measurement_unit']),
+    (Tag, '../data/tags.csv', ['name', 'color', 'slug'], ['slug']),
 ]
 
+JSON_CHUNK_SIZE = 64 * 1024
+
+CSV_CHUNK_SIZE = 1024 * 1024
+
+
+def read_csv_range(path, fieldnames, start=0, end=None):
+    """
+    Читает строки CSV-файла, начинающиеся в диапазоне байтов
+    [start, end). Строка, на которую попал start, дочитывается
+    предыдущим диапазоном.
+    """
+    with open(path, 'rb') as file:
+        if start:
+            file.seek(start - 1)
+            file.readline()
+        lines = []
+        while end is None or file.tell() < end:
+            line = file.readline()
+            if not line:
+                break
+            lines.append(line.decode('utf-8'))
+    return list(csv.DictReader(lines, fieldnames))
+
+
+def read_csv(path, fieldnames, workers, chunk_size=CSV_CHUNK_SIZE):
+    """
+    Читает CSV-файл, при workers > 1 — в нескольких процессах
+    диапазонами по chunk_size байт. В работе одновременно не больше
+    двух диапазонов на процесс, поэтому файл целиком в памяти
+    не оказывается.
+    """
+    if workers <= 1:
+        with open(path, 'r', encoding='utf-8', newline='') as file:
+            yield from csv.DictReader(file, fieldnames)
+        return
+    size = os.path.getsize(path)
+    with ProcessPoolExecutor(workers) as executor:
+        pending = deque()
+        for start in range(0, size, chunk_size):
+            pending.append(executor.submit(
+                read_csv_range, path, fieldnames, start,
+                min(start + chunk_size, size)
+            ))
+            if len(pending) > 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def read_json(path):
+    """Построчно читает объекты из JSON-массива без загрузки файла."""
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as file:
+        buffer = file.read(JSON_CHUNK_SIZE).lstrip()
+        if not buffer.startswith('['):
+            raise CommandError(f'{path} не содержит JSON-массив.')
+        buffer = buffer[1:]
+        while True:
+            buffer = buffer.lstrip().lstrip(',').lstrip()
+            if buffer.startswith(']'):
+                return
+            try:
+                item, position = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                chunk = file.read(JSON_CHUNK_SIZE)
+                if not chunk:
+                    raise CommandError(f'{path} содержит некорректный JSON.')
+                buffer += chunk
+                continue
+            yield item
+            buffer = buffer[position:]
+
 
 class Command(BaseCommand):
-    help = 'Заполняет базу данных данными из CSV-файлов'
+    help = 'Заполняет базу данных данными из CSV- и JSON-файлов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Число записей в одном INSERT'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Число процессов для чтения CSV-файлов'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только подсчитать новые записи, не сохраняя их'
+        )
 
     def handle(self, *args, **options):
-        for model, csv_file, fieldnames in DATA_SOURCES_FOR_MOVIE_DATABASE:
-            with open(csv_file, 'r', encoding='utf-8') as file:
-                reader = csv.DictReader(file, fieldnames)
-                for row in reader:
-                    model.objects.get_or_create(**row)
-            self.stdout.write(self.style.SUCCESS(
-                f'Данные из {csv_file} успешно загружены в базу данных'
-            ))
+        existing = {}
+        created = 0
+        with transaction.atomic():
+            for (model, data_file, fieldnames,
+                 key_fields) in DATA_SOURCES_FOR_MOVIE_DATABASE:
+                if data_file.endswith('.json'):
+                    rows = read_json(data_file)
+                else:
+                    rows = read_csv(data_file, fieldnames, options['workers'])
+                if model not in existing:
+                    existing[model] = set(
+                        model.objects.values_list(*key_fields)
+                    )
+                created += self.load(model, data_file, rows, fieldnames,
+                                     key_fields, existing[model], options)
+        if created and not options['dry_run']:
+            changes.bump(changes.INGREDIENTS, changes.TAGS)
+            ingredient_index.invalidate()
+            ingredient_catalog.invalidate()
+            tag_catalog.invalidate()
         self.stdout.write(self.style.SUCCESS(
             'Все данные успешно загружены в базу данных!'
         ))
+
+    def load(self, model, data_file, rows, fieldnames, key_fields,
+             existing, options):
+        """
+        Добавляет отсутствующие в базе записи пакетами и возвращает
+        число добавленных. Строки, пропущенные базой как конфликтующие,
+        не учитываются: число считается по таблице до и после загрузки.
+        При --dry-run возвращает число строк, которые будут добавлены.
+        """
+        started = time.perf_counter()
+        before = model.objects.count()
+        batch = []
+        total = queued = 0
+        for row in rows:
+            total += 1
+            key = tuple(row[field] for field in key_fields)
+            if key in existing:
+                continue
+            existing.add(key)
+            batch.append(model(**{field: row[field] for field in fieldnames}))
+            if len(batch) >= options['batch_size']:
+                queued += self.save(model, batch, options)
+                batch = []
+        queued += self.save(model, batch, options)
+        created = (
+            queued if options['dry_run']
+            else model.objects.count() - before
+        )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Данные из {data_file} успешно загружены в базу данных: '
+            f'прочитано {total}, '
+            f'{"будет добавлено" if options["dry_run"] else "добавлено"} '
+            f'{created}, '
+            f'{total / elapsed if elapsed else total:.0f} строк/с'
+        ))
+        return created
+
+    def save(self, model, batch, options):
+        if not options['dry_run'] and batch:
+            model.objects.bulk_create(batch, ignore_conflicts=True)
+        return len(batch)
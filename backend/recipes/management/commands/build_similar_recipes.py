@@ -0,0 +1,115 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Max, Min
+from django.utils import timezone
+
+from recipes import changes
+from recipes.consts import SIMILAR_RECIPES_TOP_K
+from recipes.models import Recipe, RecipeSimilarity
+from recipes.similarity import SimilarityModel
+
+
+class Command(BaseCommand):
+    help = ('Рассчитывает для каждого рецепта top-K похожих рецептов '
+            'по ингредиентам, тегам и избранному')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top-k', type=int, default=SIMILAR_RECIPES_TOP_K,
+            help='Число похожих рецептов, сохраняемых для каждого рецепта'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Число рецептов, записываемых в одной транзакции'
+        )
+        parser.add_argument(
+            '--full', action='store_true',
+            help=('Пересчитать все рецепты, а не только измененные '
+                  'с прошлого расчета')
+        )
+
+    def handle(self, *args, **options):
+        top_k = options['top_k']
+        started = time.perf_counter()
+        built_at = timezone.now()
+        model = SimilarityModel().build()
+        last_built_at = RecipeSimilarity.objects.aggregate(
+            last=Max('built_at')
+        )['last']
+        if options['full'] or last_built_at is None:
+            ids = list(Recipe.objects.values_list('pk', flat=True))
+        else:
+            ids = self.affected(model, top_k, last_built_at)
+        written = 0
+        batch_size = options['batch_size']
+        for start in range(0, len(ids), batch_size):
+            written += self.write(
+                model, ids[start:start + batch_size], top_k, built_at
+            )
+        if ids:
+            changes.bump(changes.RECIPES)
+        self.stdout.write(
+            f'Рецептов пересчитано: {len(ids)}, записей: {written}, '
+            f'за {time.perf_counter() - started:.1f} с'
+        )
+
+    @staticmethod
+    def affected(model, top_k, last_built_at):
+        """
+        Возвращает рецепты, списки похожих которых могли измениться
+        с last_built_at: сами измененные рецепты, рецепты, у которых
+        они уже есть в списке, и рецепты, в список которых измененный
+        рецепт теперь попадает по сходству. IDF остальных признаков
+        при этом не пересчитывается, поэтому время от времени нужен
+        полный расчет с --full.
+        """
+        changed = set(Recipe.objects.filter(
+            updated_at__gt=last_built_at
+        ).values_list('pk', flat=True))
+        ids = changed | set(RecipeSimilarity.objects.filter(
+            similar_id__in=changed
+        ).values_list('recipe_id', flat=True))
+        scores = {}
+        for pk in changed:
+            for other, score in model.neighbours(pk, top_k):
+                scores[other] = max(score, scores.get(other, 0))
+        stored = {
+            row['recipe_id']: row
+            for row in RecipeSimilarity.objects.filter(
+                recipe_id__in=scores
+            ).values('recipe_id').annotate(
+                count=Count('id'), lowest=Min('score')
+            )
+        }
+        for other, score in scores.items():
+            row = stored.get(other)
+            if row is None or row['count'] < top_k or (
+                score > row['lowest']
+            ):
+                ids.add(other)
+        return sorted(ids)
+
+    @staticmethod
+    def write(model, ids, top_k, built_at):
+        """Заменяет сохраненные похожие рецепты для рецептов ids."""
+        neighbours = {pk: model.neighbours(pk, top_k) for pk in ids}
+        with transaction.atomic():
+            # Рецепты, удаленные во время расчета, не записываем.
+            existing = set(Recipe.objects.filter(pk__in={
+                *ids,
+                *(other for pairs in neighbours.values()
+                  for other, _ in pairs)
+            }).values_list('pk', flat=True))
+            RecipeSimilarity.objects.filter(recipe_id__in=ids).delete()
+            return len(RecipeSimilarity.objects.bulk_create(
+                RecipeSimilarity(
+                    recipe_id=pk,
+                    similar_id=other,
+                    score=score,
+                    built_at=built_at
+                )
+                for pk, pairs in neighbours.items() if pk in existing
+                for other, score in pairs if other in existing
+            ))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from recipes.consts import TIMELINE_FANOUT_BATCH_SIZE
+from recipes.timeline import fan_out_pending
+
+
+class Command(BaseCommand):
+    help = ('Раскладывает неразосланные рецепты в ленты подписок '
+            'подписчиков их авторов')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=TIMELINE_FANOUT_BATCH_SIZE,
+            help='Число записей ленты, создаваемых одним запросом'
+        )
+
+    def handle(self, *args, **options):
+        recipes, written = fan_out_pending(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Рецептов разослано: {recipes}, записей ленты: {written}'
+        ))
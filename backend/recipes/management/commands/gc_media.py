@@ -0,0 +1,110 @@
+import posixpath
+from datetime import timedelta
+from itertools import islice
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from recipes.models import Recipe, StoredFile
+
+MEDIA_DIRECTORIES = ('recipes/images',)
+
+
+def walk(storage, directory):
+    """Перебирает имена файлов каталога хранилища рекурсивно."""
+    if not storage.exists(directory):
+        return
+    directories, files = storage.listdir(directory)
+    for file_name in files:
+        yield posixpath.join(directory, file_name)
+    for subdirectory in directories:
+        yield from walk(storage, posixpath.join(directory, subdirectory))
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Command(BaseCommand):
+    help = ('Удаляет из хранилища медиа файлы изображений рецептов, '
+            'на которые не осталось ссылок')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Число файлов, проверяемых одним запросом'
+        )
+        parser.add_argument(
+            '--min-age', type=int, default=3600,
+            help=('Минимальный возраст удаляемого файла в секундах, '
+                  'чтобы не задеть загрузки в незавершенных транзакциях')
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только подсчитать файлы без ссылок, не удаляя их'
+        )
+
+    def handle(self, *args, **options):
+        storage = default_storage
+        threshold = timezone.now() - timedelta(seconds=options['min_age'])
+        checked = removed = 0
+        for directory in MEDIA_DIRECTORIES:
+            for names in batches(walk(storage, directory),
+                                 options['batch_size']):
+                checked += len(names)
+                orphans = self.orphans(storage, names, threshold)
+                if options['dry_run'] or not orphans:
+                    removed += len(orphans)
+                    continue
+                # Повторная загрузка того же файла после проверки
+                # обновляет время его изменения.
+                orphans = [
+                    name for name in orphans
+                    if storage.get_modified_time(name) < threshold
+                ]
+                for name in orphans:
+                    storage.delete(name)
+                removed += len(orphans)
+                StoredFile.objects.filter(
+                    name__in=orphans, references=0
+                ).delete()
+        if not options['dry_run']:
+            self.delete_missing(storage, options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Проверено файлов: {checked}, '
+            f'{"без ссылок" if options["dry_run"] else "удалено"}: '
+            f'{removed}'
+        ))
+
+    def orphans(self, storage, names, threshold):
+        """Возвращает старые файлы пакета, на которые нет ссылок."""
+        referenced = set(StoredFile.objects.filter(
+            name__in=names, references__gt=0
+        ).values_list('name', flat=True))
+        referenced.update(Recipe.objects.filter(
+            image__in=names
+        ).values_list('image', flat=True))
+        return [
+            name for name in names
+            if name not in referenced
+            and storage.get_modified_time(name) < threshold
+        ]
+
+    def delete_missing(self, storage, batch_size):
+        """Удаляет записи без ссылок о файлах, которых уже нет."""
+        for names in batches(
+            StoredFile.objects.filter(references=0).values_list(
+                'name', flat=True
+            ).iterator(chunk_size=batch_size),
+            batch_size
+        ):
+            StoredFile.objects.filter(
+                name__in=[name for name in names if not storage.exists(name)],
+                references=0
+            ).delete()
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.counters import recount
+from recipes.models import Recipe, User
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает счетчики избранного, списка покупок, '
+            'рецептов и подписчиков')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            recount(Recipe, User)
+        self.stdout.write(self.style.SUCCESS('Счетчики пересчитаны.'))
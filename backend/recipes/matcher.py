@@ -0,0 +1,81 @@
+import heapq
+from collections import Counter, defaultdict
+from itertools import chain
+
+from recipes.consts import RECIPE_INDEX_TTL
+from recipes.indexes import LazyIndex
+
+
+class RecipeMatcher(LazyIndex):
+    """
+    Разреженная матрица «ингредиент — рецепты» в памяти процесса.
+
+    Для каждого ингредиента хранит множество рецептов, в которые он
+    входит, а для каждого рецепта — множество его ингредиентов.
+    Число совпавших ингредиентов у всех рецептов сразу считается
+    одним проходом Counter по спискам рецептов запрошенных
+    ингредиентов, то есть умножением разреженной матрицы на вектор
+    без соединений по таблице RecipeIngredient. Индекс строится
+    при первом запросе, затем сигналы записи обновляют в нем только
+    измененные рецепты; изменения из других процессов видны после
+    перестроения по истечении RECIPE_INDEX_TTL.
+    """
+
+    def __init__(self, ttl=RECIPE_INDEX_TTL):
+        super().__init__(ttl)
+
+    def fetch(self, ids=None):
+        """Возвращает словарь {id рецепта: множество id ингредиентов}."""
+        from recipes.models import RecipeIngredient
+
+        links = RecipeIngredient.objects.order_by().values_list(
+            'recipe_id', 'ingredient_id'
+        )
+        if ids is not None:
+            links = links.filter(recipe_id__in=ids)
+        recipes = defaultdict(set)
+        for recipe_id, ingredient_id in links.iterator():
+            recipes[recipe_id].add(ingredient_id)
+        return recipes
+
+    def empty(self):
+        """Возвращает пару словарей: ингредиенты рецептов и их рецепты."""
+        return {}, {}
+
+    def add(self, state, pk, ingredient_ids):
+        recipes, postings = state
+        recipes[pk] = frozenset(ingredient_ids)
+        for ingredient_id in ingredient_ids:
+            postings.setdefault(ingredient_id, set()).add(pk)
+
+    def discard(self, state, pk):
+        recipes, postings = state
+        for ingredient_id in recipes.pop(pk, ()):
+            ingredient_postings = postings[ingredient_id]
+            ingredient_postings.discard(pk)
+            if not ingredient_postings:
+                del postings[ingredient_id]
+
+    def match(self, ingredient_ids, limit):
+        """
+        Возвращает до limit кортежей (id рецепта, число имеющихся
+        ингредиентов, число ингредиентов рецепта) по убыванию доли
+        имеющихся ингредиентов, затем их числа, затем новизны рецепта.
+        """
+        recipes, postings = self.snapshot()
+        with self._lock:
+            counts = Counter(chain.from_iterable(
+                postings.get(ingredient_id, ())
+                for ingredient_id in set(ingredient_ids)
+            ))
+            matches = [
+                (pk, matched, len(recipes[pk]))
+                for pk, matched in counts.items()
+            ]
+        return heapq.nlargest(
+            limit, matches,
+            key=lambda match: (match[1] / match[2], match[1], match[0])
+        )
+
+
+recipe_matcher = RecipeMatcher()
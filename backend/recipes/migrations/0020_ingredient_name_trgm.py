@@ -0,0 +1,34 @@
+from django.db import migrations
+
+CREATE_INDEX = (
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS recipes_ingredient_name_upper_trgm '
+    'ON recipes_ingredient USING gin (UPPER(name) gin_trgm_ops)',
+)
+
+DROP_INDEX = (
+    'DROP INDEX IF EXISTS recipes_ingredient_name_upper_trgm',
+)
+
+
+def run_postgres(statements):
+    def operation(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0019_auto_20240205_1525'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_postgres(CREATE_INDEX),
+            run_postgres(DROP_INDEX),
+        ),
+    ]
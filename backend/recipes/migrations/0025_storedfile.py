@@ -0,0 +1,48 @@
+# Generated by Django 3.2.3 on 2026-10-18 01:39
+
+from collections import Counter
+
+from django.db import migrations, models
+
+
+def count_references(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    StoredFile = apps.get_model('recipes', 'StoredFile')
+    references = Counter()
+    for image, renditions in Recipe.objects.values_list(
+        'image', 'image_renditions'
+    ).iterator():
+        if image:
+            references[image] += 1
+        references.update(
+            name for rendition, name in renditions.items()
+            if rendition != 'source'
+        )
+    StoredFile.objects.bulk_create(
+        [StoredFile(name=name, references=count)
+         for name, count in references.items()],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0024_recipe_image_renditions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='Путь')),
+                ('references', models.PositiveIntegerField(default=0, verbose_name='Число ссылок')),
+            ],
+            options={
+                'verbose_name': 'файл хранилища',
+                'verbose_name_plural': 'Файлы хранилища',
+            },
+        ),
+        migrations.RunPython(count_references, migrations.RunPython.noop),
+    ]
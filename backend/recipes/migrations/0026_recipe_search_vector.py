@@ -0,0 +1,45 @@
+from django.db import migrations
+
+CREATE_SEARCH_VECTOR = (
+    'ALTER TABLE recipes_recipe '
+    'ADD COLUMN IF NOT EXISTS search_vector tsvector',
+    "UPDATE recipes_recipe SET search_vector = "
+    "setweight(to_tsvector('russian', name), 'A') || "
+    "setweight(to_tsvector('russian', coalesce(("
+    "SELECT string_agg(ingredient.name, ' ') "
+    'FROM recipes_recipeingredient AS link '
+    'JOIN recipes_ingredient AS ingredient '
+    'ON ingredient.id = link.ingredient_id '
+    "WHERE link.recipe_id = recipes_recipe.id), '')), 'B') || "
+    "setweight(to_tsvector('russian', text), 'C')",
+    'CREATE INDEX IF NOT EXISTS recipes_recipe_search_vector_gin '
+    'ON recipes_recipe USING gin (search_vector)',
+)
+
+DROP_SEARCH_VECTOR = (
+    'DROP INDEX IF EXISTS recipes_recipe_search_vector_gin',
+    'ALTER TABLE recipes_recipe DROP COLUMN IF EXISTS search_vector',
+)
+
+
+def run_postgres(statements):
+    def operation(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0025_storedfile'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_postgres(CREATE_SEARCH_VECTOR),
+            run_postgres(DROP_SEARCH_VECTOR),
+        ),
+    ]
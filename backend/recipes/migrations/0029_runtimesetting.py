@@ -0,0 +1,25 @@
+# Generated by Django 3.2.3 on 2026-10-18 02:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0028_timeline'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RuntimeSetting',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=150, unique=True, verbose_name='Ключ')),
+                ('value', models.FloatField(verbose_name='Значение')),
+            ],
+            options={
+                'verbose_name': 'настройка',
+                'verbose_name_plural': 'Настройки',
+            },
+        ),
+    ]
@@ -2,17 +2,50 @@ from django.contrib import admin
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from django.db.models import (
+    Exists, F, OuterRef, Prefetch, Q, Value, Window
+)
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber
+from django.utils import timezone
 
 from recipes.consts import (
     MAX_LEN_COLOR, MAX_LEN_EMAIL, MAX_LEN_NAME,
-    MAX_LEN_PASSWORD, MAX_LEN_RECIPE_NAME,
+    MAX_LEN_PASSWORD, MAX_LEN_RECIPE_NAME, MAX_LEN_STORED_FILE_NAME,
     MAX_VALUE_AMOUNT, MAX_VALUE_COOKING_TIME,
     MIN_VALUE_AMOUNT, MIN_VALUE_COOKING_TIME
 )
 from recipes.validators import username_validator, validate_username_me
 
 
-class User(AbstractUser):
+class CounterFieldsMixin:
+    """
+    Миксин, исключающий из обычного сохранения поля, которые
+    обновляются только атомарными UPDATE (счетчики и флаги фоновых
+    задач): иначе save() записал бы значения, прочитанные в начале
+    запроса, поверх изменений из параллельных запросов.
+    """
+
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (
+            not self._state.adding
+            and not args
+            and kwargs.get('update_fields') is None
+            and not kwargs.get('force_insert')
+        ):
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+                and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
+
+class User(CounterFieldsMixin, AbstractUser):
     """Модель пользователя."""
 
     email = models.EmailField(
@@ -39,6 +72,18 @@ class User(AbstractUser):
         max_length=MAX_LEN_PASSWORD
     )
     subscriptions = models.ManyToManyField('self', verbose_name='Подписки')
+    recipes_count = models.PositiveIntegerField(
+        'Число рецептов',
+        default=0,
+        editable=False
+    )
+    subscribers_count = models.PositiveIntegerField(
+        'Число подписчиков',
+        default=0,
+        editable=False
+    )
+
+    counter_fields = ('recipes_count', 'subscribers_count')
 
     class Meta:
         ordering = ('username',)
@@ -92,7 +137,87 @@ class Tag(models.Model):
         return self.name
 
 
-class Recipe(models.Model):
+class RecipeQuerySet(models.QuerySet):
+    """Набор запросов рецептов."""
+
+    def for_read(self, user):
+        """
+        Подготавливает рецепты к чтению за фиксированное
+        число запросов независимо от размера страницы. Для user=None
+        и анонимного пользователя флаги избранного, списка покупок
+        и подписки ложны.
+        """
+        authors = User.objects.all()
+        queryset = self.prefetch_related(
+            Prefetch(
+                'tags',
+                queryset=RecipeTag.objects.select_related('tag').order_by(
+                    'tag__name'
+                )
+            ),
+            Prefetch(
+                'ingredients',
+                queryset=RecipeIngredient.objects.select_related('ingredient')
+            )
+        )
+        if user is None or user.id is None:
+            return queryset.prefetch_related(
+                Prefetch(
+                    'author',
+                    queryset=authors.annotate(is_subscribed=Value(False))
+                )
+            ).annotate(
+                is_favorited=Value(False),
+                is_in_shopping_cart=Value(False)
+            )
+        return queryset.prefetch_related(
+            Prefetch(
+                'author',
+                queryset=authors.annotate(
+                    is_subscribed=Exists(
+                        User.subscriptions.through.objects.filter(
+                            from_user=user, to_user=OuterRef('pk')
+                        )
+                    )
+                )
+            )
+        ).annotate(
+            is_favorited=Exists(
+                Recipe.favorite_recipes.through.objects.filter(
+                    recipe=OuterRef('pk'), user=user
+                )
+            ),
+            is_in_shopping_cart=Exists(
+                Recipe.shopping_cart_recipes.through.objects.filter(
+                    recipe=OuterRef('pk'), user=user
+                )
+            )
+        )
+
+    def latest_by_authors(self, author_ids, limit=None):
+        """
+        Возвращает последние рецепты авторов, не более limit на каждого.
+        Ограничение применяется в одном запросе через ROW_NUMBER().
+        """
+        queryset = self.filter(author_id__in=author_ids)
+        if limit is not None:
+            ranked = queryset.annotate(
+                row_number=Window(
+                    RowNumber(),
+                    partition_by=F('author_id'),
+                    order_by=(F('pub_date').desc(), F('id').desc())
+                )
+            ).order_by().values('id', 'row_number')
+            sql, params = ranked.query.sql_with_params()
+            queryset = self.filter(pk__in=RawSQL(
+                f'SELECT ranked.id FROM ({sql}) ranked '
+                'WHERE ranked.row_number <= %s',
+                (*params, limit)
+            ))
+        return queryset.order_by('author_id', '-pub_date', '-id')
+
+
+class Recipe(CounterFieldsMixin, models.Model):
     """Модель рецепта."""
 
     author = models.ForeignKey(
@@ -106,6 +231,11 @@ class Recipe(models.Model):
         default=None,
         verbose_name='Изображение'
     )
+    image_renditions = models.JSONField(
+        'Уменьшенные копии изображения',
+        default=dict,
+        editable=False
+    )
     text = models.TextField('Описание')
     ingredients_fk = models.ManyToManyField(
         Ingredient,
@@ -142,14 +272,68 @@ class Recipe(models.Model):
         blank=True
     )
     pub_date = models.DateTimeField('Дата публикации', auto_now_add=True)
+    updated_at = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True,
+        db_index=True
+    )
+    fanned_out = models.BooleanField(
+        'Разослан в ленты подписчиков',
+        default=False,
+        editable=False
+    )
+    favorites_count = models.PositiveIntegerField(
+        'Число добавлений в избранное',
+        default=0,
+        editable=False
+    )
+    shopping_cart_count = models.PositiveIntegerField(
+        'Число добавлений в список покупок',
+        default=0,
+        editable=False
+    )
+
+    objects = RecipeQuerySet.as_manager()
+
+    counter_fields = ('favorites_count', 'shopping_cart_count', 'fanned_out')
 
     @property
     @admin.display(description='Общее число добавлений рецепта в избранное')
     def count_is_favorited(self):
-        return self.favorite_recipes.count()
+        return self.favorites_count
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.loaded_files = instance.stored_files()
+        return instance
+
+    def stored_files(self):
+        """Возвращает имена файлов хранилища, на которые ссылается рецепт."""
+        deferred = self.get_deferred_fields()
+        names = set()
+        if 'image' not in deferred and self.image:
+            names.add(self.image.name)
+        if 'image_renditions' not in deferred:
+            names.update(
+                name for rendition, name in self.image_renditions.items()
+                if rendition != 'source'
+            )
+        return names
 
     class Meta:
         ordering = ('-pub_date',)
+        indexes = (
+            models.Index(
+                fields=('-pub_date', '-id'),
+                name='recipe_pub_date_id_idx'
+            ),
+            models.Index(
+                fields=('author', '-pub_date', '-id'),
+                condition=Q(fanned_out=False),
+                name='recipe_pending_fanout_idx'
+            ),
+        )
         default_related_name = 'recipes'
         verbose_name = 'рецепт'
         verbose_name_plural = 'Рецепты'
@@ -221,3 +405,136 @@ class RecipeTag(models.Model):
 
     def __str__(self):
         return self.tag.name
+
+
+class RecipeSimilarity(models.Model):
+    """
+    Модель похожего рецепта: одна из top-K записей с наибольшим
+    сходством, рассчитанных командой build_similar_recipes.
+    """
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similarities',
+        verbose_name='Рецепт'
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Похожий рецепт'
+    )
+    score = models.FloatField('Сходство')
+    built_at = models.DateTimeField('Дата расчета')
+
+    class Meta:
+        ordering = ('recipe', '-score')
+        constraints = (
+            models.UniqueConstraint(
+                fields=('recipe', 'similar'),
+                name='unique_recipe_similarity'
+            ),
+        )
+        verbose_name = 'похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+
+    def __str__(self):
+        return f'{self.recipe_id} ~ {self.similar_id}: {self.score:.3f}'
+
+
+class TimelineEntry(models.Model):
+    """
+    Модель записи ленты подписок: рецепт автора, на которого
+    подписан пользователь. Записи создаются при публикации рецепта.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Пользователь'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Рецепт'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор рецепта'
+    )
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        ordering = ('user', '-pub_date', '-recipe')
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_timeline_entry'
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=('user', '-pub_date', '-recipe'),
+                name='timeline_user_pub_date_idx'
+            ),
+        )
+        verbose_name = 'запись ленты подписок'
+        verbose_name_plural = 'Ленты подписок'
+
+    def __str__(self):
+        return f'{self.user_id}: {self.recipe_id}'
+
+
+class ChangeCounter(models.Model):
+    """
+    Модель счетчика изменений таблицы или пользовательских данных.
+    Используется для валидаторов условных запросов.
+    """
+
+    key = models.CharField('Ключ', max_length=MAX_LEN_NAME, unique=True)
+    version = models.PositiveBigIntegerField('Версия', default=0)
+    modified = models.DateTimeField('Дата изменения', default=timezone.now)
+
+    class Meta:
+        verbose_name = 'счетчик изменений'
+        verbose_name_plural = 'Счетчики изменений'
+
+    def __str__(self):
+        return f'{self.key}: {self.version}'
+
+
+class RuntimeSetting(models.Model):
+    """
+    Модель настройки, измененной во время работы. В отличие
+    от кэша значение общее для всех процессов и не вытесняется.
+    """
+
+    key = models.CharField('Ключ', max_length=MAX_LEN_NAME, unique=True)
+    value = models.FloatField('Значение')
+
+    class Meta:
+        verbose_name = 'настройка'
+        verbose_name_plural = 'Настройки'
+
+    def __str__(self):
+        return f'{self.key}: {self.value}'
+
+
+class StoredFile(models.Model):
+    """Модель файла хранилища медиа с числом ссылок на него."""
+
+    name = models.CharField('Путь', max_length=MAX_LEN_STORED_FILE_NAME,
+                            unique=True)
+    references = models.PositiveIntegerField('Число ссылок', default=0)
+
+    class Meta:
+        verbose_name = 'файл хранилища'
+        verbose_name_plural = 'Файлы хранилища'
+
+    def __str__(self):
+        return f'{self.name}: {self.references}'
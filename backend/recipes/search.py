@@ -0,0 +1,336 @@
+import math
+import re
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from functools import lru_cache
+from itertools import islice
+
+from django.db import connection
+
+from recipes.consts import (
+    BM25_B, BM25_K1, INGREDIENT_INDEX_TTL, INGREDIENT_SEARCH_MAX_RESULTS,
+    RECIPE_INDEX_TTL, RECIPE_SEARCH_CONFIG, RECIPE_SEARCH_WEIGHTS,
+    SEARCH_STOP_WORDS
+)
+from recipes.indexes import LazyIndex
+
+WORD_START = re.compile(r'\b\w')
+WORD = re.compile(r'\w+')
+
+# Окончания облегченного стеммера Портера для русского языка.
+PERFECTIVE_GERUND = re.compile(
+    r'((ив|ивши|ившись|ыв|ывши|ывшись)|((?<=[ая])(в|вши|вшись)))$'
+)
+REFLEXIVE = re.compile(r'(с[яь])$')
+ADJECTIVE = re.compile(
+    r'(ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых|'
+    r'ую|юю|ая|яя|ою|ею)$'
+)
+PARTICIPLE = re.compile(r'((ивш|ывш|ующ)|((?<=[ая])(ем|нн|вш|ющ|щ)))$')
+VERB = re.compile(
+    r'((ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|'
+    r'ено|ят|ует|уют|ит|ыт|ены|ить|ыть|ишь|ую|ю)|'
+    r'((?<=[ая])(ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)))$'
+)
+NOUN = re.compile(
+    r'(а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|ем|'
+    r'ам|ом|о|у|ах|иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$'
+)
+SUPERLATIVE = re.compile(r'(ейше|ейш)$')
+DERIVATIONAL = re.compile(r'[^аеиоуыэюя][аеиоуыэюя].*ость?$')
+RV = re.compile(r'^(.*?[аеиоуыэюя])(.*)$')
+
+
+def normalize(value):
+    """Приводит строку к виду для поиска без учета регистра и ё."""
+    return value.casefold().replace('ё', 'е').strip()
+
+
+@lru_cache(maxsize=65536)
+def stem(word):
+    """
+    Отрезает от русского слова окончание по упрощенному алгоритму
+    Портера: «томатный», «томаты» и «томатов» дают «томатн» и «томат».
+    Слова без кириллицы возвращаются без изменений.
+    """
+    match = RV.match(word)
+    if match is None:
+        return word
+    start, rv = match.groups()
+    stripped = PERFECTIVE_GERUND.sub('', rv, 1)
+    if stripped == rv:
+        rv = REFLEXIVE.sub('', rv, 1)
+        stripped = ADJECTIVE.sub('', rv, 1)
+        if stripped != rv:
+            rv = PARTICIPLE.sub('', stripped, 1)
+        else:
+            stripped = VERB.sub('', rv, 1)
+            rv = NOUN.sub('', rv, 1) if stripped == rv else stripped
+    else:
+        rv = stripped
+    if rv.endswith('и'):
+        rv = rv[:-1]
+    if DERIVATIONAL.search(rv):
+        rv = re.sub(r'ость?$', '', rv)
+    if rv.endswith('ь'):
+        rv = rv[:-1]
+    else:
+        rv = SUPERLATIVE.sub('', rv, 1)
+        if rv.endswith('нн'):
+            rv = rv[:-1]
+    return start + rv
+
+
+def tokenize(value):
+    """Возвращает основы слов строки без стоп-слов."""
+    return [
+        stem(word) for word in WORD.findall(normalize(value))
+        if word not in SEARCH_STOP_WORDS
+    ]
+
+
+def trigrams(value):
+    """Возвращает множество подстрок value длиной в три символа."""
+    return {value[start:start + 3] for start in range(len(value) - 2)}
+
+
+class IngredientIndexState:
+    """Данные построенного индекса ингредиентов."""
+
+    def __init__(self):
+        self.names = []
+        self.words = []
+        self.keys = {}
+        self.trigrams = defaultdict(set)
+
+
+class IngredientIndex(LazyIndex):
+    """
+    Префиксный индекс названий ингредиентов в памяти процесса.
+
+    Хранит отсортированный список пар (ключ, id) для начала названия
+    и каждого следующего слова, а для поиска вхождений — множества id
+    по триграммам названий. Строится из таблицы при первом обращении,
+    сбрасывается сигналами записи и по истечении INGREDIENT_INDEX_TTL,
+    чтобы изменения из других процессов тоже были видны.
+    """
+
+    def __init__(self, ttl=INGREDIENT_INDEX_TTL):
+        super().__init__(ttl)
+
+    def load(self):
+        """Строит индекс по текущему содержимому таблицы."""
+        from recipes.models import Ingredient
+
+        state = IngredientIndexState()
+        for pk, name in Ingredient.objects.values_list('id', 'name'):
+            key = normalize(name)
+            state.names.append((key, pk))
+            state.words.extend(
+                (key[word.start():], pk)
+                for word in WORD_START.finditer(key) if word.start()
+            )
+            state.keys[pk] = key
+            for trigram in trigrams(key):
+                state.trigrams[trigram].add(pk)
+        state.names.sort()
+        state.words.sort()
+        return state
+
+    @staticmethod
+    def prefix_range(keys, prefix):
+        """Возвращает id записей, ключ которых начинается с prefix."""
+        position = bisect_left(keys, (prefix,))
+        while position < len(keys) and keys[position][0].startswith(prefix):
+            yield keys[position][1]
+            position += 1
+
+    @staticmethod
+    def containing(state, value):
+        """
+        Возвращает id записей, ключ которых содержит value. Кандидаты
+        отбираются пересечением множеств по триграммам value, поэтому
+        для value короче трех символов вхождения не ищутся.
+        """
+        postings = sorted(
+            (state.trigrams.get(trigram, set())
+             for trigram in trigrams(value)),
+            key=len
+        )
+        if not postings:
+            return []
+        return [
+            pk for pk in postings[0].intersection(*postings[1:])
+            if value in state.keys[pk]
+        ]
+
+    def search(self, query, limit=INGREDIENT_SEARCH_MAX_RESULTS):
+        """
+        Возвращает до limit id ингредиентов по убыванию релевантности:
+        сначала названия, начинающиеся с запроса, затем названия,
+        в которых с запроса начинается одно из слов, затем прочие
+        вхождения. Для пустого запроса возвращает пустой список.
+        """
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        state = self.snapshot()
+        found = dict.fromkeys(
+            islice(self.prefix_range(state.names, prefix), limit)
+        )
+        for pk in self.prefix_range(state.words, prefix):
+            if len(found) >= limit:
+                break
+            found.setdefault(pk)
+        if len(found) < limit:
+            found.update(
+                (pk, None) for _, _, pk in sorted(
+                    (state.keys[pk].find(prefix), state.keys[pk], pk)
+                    for pk in self.containing(state, prefix)
+                    if pk not in found
+                )[:limit - len(found)]
+            )
+        return list(found)
+
+
+class RecipeIndexState:
+    """Данные построенного индекса рецептов."""
+
+    def __init__(self):
+        self.postings = {}
+        self.documents = {}
+        self.lengths = {}
+        self.total_length = 0
+
+
+class RecipeIndex(LazyIndex):
+    """
+    Инвертированный индекс рецептов в памяти процесса.
+
+    Для каждой основы слова хранит частоту в названии, тексте
+    и названиях ингредиентов рецепта с весами RECIPE_SEARCH_WEIGHTS,
+    а поиск ранжирует рецепты по BM25. Индекс строится при первом
+    поиске, после этого сигналы записи обновляют в нем только
+    измененные рецепты. Изменения из других процессов становятся
+    видны после перестроения по истечении RECIPE_INDEX_TTL.
+    """
+
+    def __init__(self, ttl=RECIPE_INDEX_TTL):
+        super().__init__(ttl)
+
+    def fetch(self, ids=None):
+        """Возвращает словарь {id рецепта: частоты основ слов}."""
+        from recipes.models import Recipe, RecipeIngredient
+
+        recipes = Recipe.objects.order_by().values_list('id', 'name', 'text')
+        ingredients = RecipeIngredient.objects.order_by().values_list(
+            'recipe_id', 'ingredient__name'
+        )
+        if ids is not None:
+            recipes = recipes.filter(pk__in=ids)
+            ingredients = ingredients.filter(recipe_id__in=ids)
+        ingredient_names = defaultdict(list)
+        for recipe_id, name in ingredients.iterator():
+            ingredient_names[recipe_id].append(name)
+        documents = {}
+        for pk, name, text in recipes.iterator():
+            terms = Counter()
+            for field, value in (
+                ('name', name),
+                ('ingredients', ' '.join(ingredient_names[pk])),
+                ('text', text),
+            ):
+                for term in tokenize(value):
+                    terms[term] += RECIPE_SEARCH_WEIGHTS[field]
+            documents[pk] = terms
+        return documents
+
+    def empty(self):
+        return RecipeIndexState()
+
+    def add(self, state, pk, terms):
+        state.documents[pk] = terms
+        length = sum(terms.values())
+        state.lengths[pk] = length
+        state.total_length += length
+        for term, frequency in terms.items():
+            state.postings.setdefault(term, {})[pk] = frequency
+
+    def discard(self, state, pk):
+        terms = state.documents.pop(pk, None)
+        if terms is None:
+            return
+        state.total_length -= state.lengths.pop(pk)
+        for term in terms:
+            postings = state.postings[term]
+            del postings[pk]
+            if not postings:
+                del state.postings[term]
+
+    def search(self, query, limit=None):
+        """
+        Возвращает id рецептов, содержащих хотя бы одно слово запроса,
+        по убыванию BM25, при равенстве — сначала новые.
+        """
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        state = self.snapshot()
+        scores = defaultdict(float)
+        with self._lock:
+            count = len(state.lengths)
+            if not count:
+                return []
+            average_length = state.total_length / count
+            for term in terms:
+                postings = state.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(
+                    1 + (count - len(postings) + 0.5) / (len(postings) + 0.5)
+                )
+                for pk, frequency in postings.items():
+                    scores[pk] += idf * frequency * (BM25_K1 + 1) / (
+                        frequency + BM25_K1 * (
+                            1 - BM25_B
+                            + BM25_B * state.lengths[pk] / average_length
+                        )
+                    )
+        ranked = sorted(scores, key=lambda pk: (-scores[pk], -pk))
+        return ranked[:limit] if limit is not None else ranked
+
+
+SEARCH_VECTOR_SQL = (
+    'UPDATE recipes_recipe SET search_vector = '
+    f"setweight(to_tsvector('{RECIPE_SEARCH_CONFIG}', name), 'A') || "
+    f"setweight(to_tsvector('{RECIPE_SEARCH_CONFIG}', coalesce(("
+    "SELECT string_agg(ingredient.name, ' ') "
+    'FROM recipes_recipeingredient AS link '
+    'JOIN recipes_ingredient AS ingredient '
+    'ON ingredient.id = link.ingredient_id '
+    "WHERE link.recipe_id = recipes_recipe.id), '')), 'B') || "
+    f"setweight(to_tsvector('{RECIPE_SEARCH_CONFIG}', text), 'C') "
+    'WHERE id = ANY(%s)'
+)
+
+
+def update_search_vectors(ids):
+    """
+    Пересчитывает столбец search_vector рецептов ids в PostgreSQL.
+    Столбец и GIN-индекс по нему создает миграция только в PostgreSQL,
+    поэтому в модели их нет.
+    """
+    if connection.vendor != 'postgresql' or not ids:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(SEARCH_VECTOR_SQL, (list(ids),))
+
+
+def reindex_recipes(ids):
+    """Обновляет поисковые данные рецептов после их изменения."""
+    update_search_vectors(ids)
+    recipe_index.update(ids)
+
+
+ingredient_index = IngredientIndex()
+recipe_index = RecipeIndex()
@@ -0,0 +1,286 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_save, pre_delete
+)
+from django.dispatch import receiver
+
+from recipes import changes
+from recipes.images import renditions_outdated, schedule_renditions
+from recipes.matcher import recipe_matcher
+from recipes.models import (
+    Ingredient, Recipe, RecipeIngredient, RecipeTag, Tag, User
+)
+from recipes.search import (
+    ingredient_index, recipe_index, reindex_recipes, update_search_vectors
+)
+from recipes.storage import release, retain
+from recipes.timeline import backfill, forget, schedule_fan_out
+
+COUNTER_DELTAS = {'post_add': 1, 'pre_remove': -1, 'pre_clear': -1}
+
+# Поля пользователя, которых нет в ответах API.
+USER_PRIVATE_FIELDS = frozenset(('password', 'last_login'))
+
+
+def shift_counter(queryset, counter, delta):
+    """Атомарно изменяет счетчик у записей queryset."""
+    if delta:
+        queryset.update(**{counter: F(counter) + delta})
+
+
+def update_recipe_counter(through, counter, instance, action, reverse,
+                          pk_set):
+    """Обновляет счетчик рецепта при изменении связи с пользователями."""
+    delta = COUNTER_DELTAS.get(action)
+    if delta is None:
+        return
+    if reverse:
+        links = through.objects.filter(user=instance)
+        if pk_set is not None:
+            links = links.filter(recipe_id__in=pk_set)
+        shift_counter(
+            Recipe.objects.filter(pk__in=links.values('recipe_id')),
+            counter,
+            delta
+        )
+        return
+    links = through.objects.filter(recipe=instance)
+    if pk_set is not None:
+        links = links.filter(user_id__in=pk_set)
+    shift_counter(
+        Recipe.objects.filter(pk=instance.pk), counter, delta * links.count()
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def count_created_recipe(instance, created, **kwargs):
+    if created:
+        shift_counter(
+            User.objects.filter(pk=instance.author_id), 'recipes_count', 1
+        )
+
+
+@receiver(post_save, sender=Recipe)
+def render_recipe_image(instance, **kwargs):
+    if renditions_outdated(instance):
+        schedule_renditions(instance)
+
+
+@receiver(post_save, sender=Recipe)
+def count_file_references(instance, **kwargs):
+    loaded = getattr(instance, 'loaded_files', set())
+    current = instance.stored_files()
+    retain(current - loaded)
+    release(loaded - current)
+    instance.loaded_files = current
+
+
+@receiver(post_delete, sender=Recipe)
+def release_file_references(instance, **kwargs):
+    release(instance.stored_files())
+
+
+@receiver(post_delete, sender=Recipe)
+def count_deleted_recipe(instance, **kwargs):
+    shift_counter(
+        User.objects.filter(pk=instance.author_id), 'recipes_count', -1
+    )
+
+
+@receiver(m2m_changed, sender=Recipe.favorite_recipes.through)
+def count_favorites(instance, action, reverse, pk_set, **kwargs):
+    update_recipe_counter(
+        Recipe.favorite_recipes.through, 'favorites_count',
+        instance, action, reverse, pk_set
+    )
+
+
+@receiver(m2m_changed, sender=Recipe.shopping_cart_recipes.through)
+def count_shopping_cart(instance, action, reverse, pk_set, **kwargs):
+    update_recipe_counter(
+        Recipe.shopping_cart_recipes.through, 'shopping_cart_count',
+        instance, action, reverse, pk_set
+    )
+
+
+@receiver(m2m_changed, sender=User.subscriptions.through)
+def count_subscribers(instance, action, pk_set, **kwargs):
+    """
+    Обновляет число подписчиков. Связь подписок симметрична, поэтому
+    Django добавляет и удаляет обратную запись без отдельного сигнала.
+    """
+    delta = COUNTER_DELTAS.get(action)
+    if delta is None:
+        return
+    links = User.subscriptions.through.objects.filter(from_user=instance)
+    if pk_set is not None:
+        links = links.filter(to_user_id__in=pk_set)
+    target_ids = list(links.values_list('to_user_id', flat=True))
+    shift_counter(
+        User.objects.filter(pk__in=target_ids), 'subscribers_count', delta
+    )
+    if User.subscriptions.field.remote_field.symmetrical:
+        shift_counter(
+            User.objects.filter(pk=instance.pk),
+            'subscribers_count',
+            delta * len(target_ids)
+        )
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_created_recipe(instance, created, **kwargs):
+    """Рассылает новый рецепт в ленты подписчиков автора."""
+    if created:
+        schedule_fan_out(instance)
+
+
+@receiver(m2m_changed, sender=User.subscriptions.through)
+def update_timelines(instance, action, pk_set, **kwargs):
+    """
+    Добавляет в ленту последние рецепты нового автора и убирает
+    рецепты автора после отписки, в том числе по обратной записи
+    симметричной связи.
+    """
+    if action not in ('post_add', 'pre_remove', 'pre_clear'):
+        return
+    if pk_set is None:
+        pk_set = User.subscriptions.through.objects.filter(
+            from_user=instance
+        ).values_list('to_user_id', flat=True)
+    pairs = [(instance.pk, user_id) for user_id in pk_set]
+    if User.subscriptions.field.remote_field.symmetrical:
+        pairs += [(user_id, author_id) for author_id, user_id in pairs]
+    if action == 'post_add':
+        backfill(pairs)
+    else:
+        forget(pairs)
+
+
+@receiver(pre_delete, sender=User)
+def uncount_deleted_user(instance, **kwargs):
+    """Убирает удаляемого пользователя из счетчиков других записей."""
+    shift_counter(
+        Recipe.objects.filter(favorite_recipes=instance),
+        'favorites_count',
+        -1
+    )
+    shift_counter(
+        Recipe.objects.filter(shopping_cart_recipes=instance),
+        'shopping_cart_count',
+        -1
+    )
+    shift_counter(
+        User.objects.filter(
+            pk__in=User.subscriptions.through.objects.filter(
+                from_user=instance
+            ).values('to_user_id')
+        ),
+        'subscribers_count',
+        -1
+    )
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredient_index(**kwargs):
+    """Сбрасывает поисковый индекс ингредиентов при их изменении."""
+    ingredient_index.invalidate()
+
+
+@receiver(post_save, sender=Recipe)
+def index_recipe(instance, **kwargs):
+    """
+    Переиндексирует рецепт после фиксации транзакции, когда
+    его ингредиенты уже записаны.
+    """
+    transaction.on_commit(lambda: reindex_recipes((instance.pk,)))
+
+
+@receiver(post_delete, sender=Recipe)
+def unindex_recipe(instance, **kwargs):
+    """Убирает удаленный рецепт из поискового индекса."""
+    pk = instance.pk
+    transaction.on_commit(lambda: recipe_index.remove((pk,)))
+
+
+@receiver(post_save, sender=Recipe)
+def match_index_recipe(instance, **kwargs):
+    """Обновляет ингредиенты рецепта в индексе подбора по продуктам."""
+    pk = instance.pk
+    transaction.on_commit(lambda: recipe_matcher.update((pk,)))
+
+
+@receiver(post_delete, sender=Recipe)
+def match_unindex_recipe(instance, **kwargs):
+    """Убирает удаленный рецепт из индекса подбора по продуктам."""
+    pk = instance.pk
+    transaction.on_commit(lambda: recipe_matcher.remove((pk,)))
+
+
+@receiver(post_save, sender=Ingredient)
+def reindex_ingredient_recipes(instance, created, **kwargs):
+    """Обновляет поиск рецептов после переименования ингредиента."""
+    if created:
+        return
+    recipe_index.invalidate()
+    recipe_ids = list(
+        RecipeIngredient.objects.filter(ingredient=instance).values_list(
+            'recipe_id', flat=True
+        )
+    )
+    transaction.on_commit(lambda: update_search_vectors(recipe_ids))
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+@receiver((post_save, post_delete), sender=RecipeTag)
+def track_recipe_changes(**kwargs):
+    changes.bump(changes.RECIPES)
+
+
+@receiver((post_save, post_delete), sender=User)
+def track_user_changes(update_fields=None, **kwargs):
+    """
+    Не сбрасывает кэш ответов, когда сохранены только поля,
+    которых нет в ответах API: пароль при перехешировании
+    во время входа и время последнего входа.
+    """
+    if update_fields and USER_PRIVATE_FIELDS.issuperset(update_fields):
+        return
+    changes.bump(changes.USERS)
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def track_tag_changes(**kwargs):
+    changes.bump(changes.TAGS)
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def track_ingredient_changes(**kwargs):
+    changes.bump(changes.INGREDIENTS)
+
+
+@receiver(m2m_changed, sender=Recipe.favorite_recipes.through)
+@receiver(m2m_changed, sender=Recipe.shopping_cart_recipes.through)
+@receiver(m2m_changed, sender=User.subscriptions.through)
+def track_user_state_changes(sender, instance, action, model, pk_set,
+                             **kwargs):
+    """
+    Отмечает изменение избранного, списка покупок и подписок
+    у затронутых пользователей.
+    """
+    if action not in COUNTER_DELTAS:
+        return
+    user_ids = {instance.pk} if isinstance(instance, User) else set()
+    if model is User:
+        if pk_set is None and sender is User.subscriptions.through:
+            pk_set = sender.objects.filter(from_user=instance).values_list(
+                'to_user_id', flat=True
+            )
+        elif pk_set is None:
+            pk_set = sender.objects.filter(recipe=instance).values_list(
+                'user_id', flat=True
+            )
+        user_ids.update(pk_set)
+    if user_ids:
+        changes.bump(*(changes.user_key(user_id) for user_id in user_ids))
@@ -0,0 +1,120 @@
+import heapq
+import math
+from collections import defaultdict
+
+from recipes.consts import (
+    SIMILAR_RECIPES_MAX_POSTINGS, SIMILAR_RECIPES_RESCORE,
+    SIMILAR_RECIPES_WEIGHTS
+)
+
+
+class SimilarityModel:
+    """
+    Разреженные TF-IDF векторы рецептов для поиска похожих.
+
+    Признаки рецепта — его ингредиенты, теги и пользователи, добавившие
+    его в избранное; вес признака равен весу группы из
+    SIMILAR_RECIPES_WEIGHTS, умноженному на IDF, векторы нормированы,
+    так что сходство двух рецептов — косинус между векторами.
+    Кандидаты в похожие собираются только по спискам признаков, которые
+    встречаются не более чем в max_postings рецептах: частые признаки
+    вроде соли или популярного тега почти не влияют на сходство, но
+    дали бы перебор всех рецептов. Лучшие кандидаты затем
+    пересчитываются точно, по всем признакам.
+    """
+
+    def __init__(self, max_postings=SIMILAR_RECIPES_MAX_POSTINGS,
+                 rescore=SIMILAR_RECIPES_RESCORE):
+        self.max_postings = max_postings
+        self.rescore = rescore
+        self.vectors = {}
+        self.postings = {}
+
+    @staticmethod
+    def fetch():
+        """Возвращает словарь {id рецепта: {(группа, id): вес группы}}."""
+        from recipes.models import Recipe, RecipeIngredient, RecipeTag
+
+        groups = {
+            'ingredients': RecipeIngredient.objects.values_list(
+                'recipe_id', 'ingredient_id'
+            ),
+            'tags': RecipeTag.objects.values_list('recipe_id', 'tag_id'),
+            'favorites': Recipe.favorite_recipes.through.objects.values_list(
+                'recipe_id', 'user_id'
+            ),
+        }
+        features = defaultdict(dict)
+        for group, links in groups.items():
+            weight = SIMILAR_RECIPES_WEIGHTS[group]
+            for recipe_id, value in links.order_by().iterator():
+                features[recipe_id][group, value] = weight
+        return features
+
+    def build(self):
+        """Строит векторы и списки признаков по текущим данным."""
+        features = self.fetch()
+        frequencies = defaultdict(int)
+        for recipe_features in features.values():
+            for feature in recipe_features:
+                frequencies[feature] += 1
+        total = len(features)
+        idf = {
+            feature: math.log((total + 1) / (frequency + 1)) + 1
+            for feature, frequency in frequencies.items()
+        }
+        self.vectors = {}
+        self.postings = defaultdict(list)
+        for pk, recipe_features in features.items():
+            vector = {
+                feature: weight * idf[feature]
+                for feature, weight in recipe_features.items()
+            }
+            norm = math.sqrt(sum(value * value for value in vector.values()))
+            for feature in vector:
+                vector[feature] /= norm
+                self.postings[feature].append((pk, vector[feature]))
+            self.vectors[pk] = vector
+        return self
+
+    def similarity(self, vector, pk):
+        """Считает косинус между vector и вектором рецепта pk."""
+        other = self.vectors[pk]
+        if len(other) < len(vector):
+            vector, other = other, vector
+        return sum(
+            value * other[feature]
+            for feature, value in vector.items() if feature in other
+        )
+
+    def neighbours(self, pk, limit):
+        """
+        Возвращает до limit пар (id похожего рецепта, сходство)
+        по убыванию сходства.
+        """
+        vector = self.vectors.get(pk)
+        if not vector:
+            return []
+        rare = [
+            feature for feature in vector
+            if len(self.postings[feature]) <= self.max_postings
+        ]
+        if not rare:
+            # У рецепта одни частые признаки: берем самый редкий из них.
+            rare = [min(vector, key=lambda feature: len(
+                self.postings[feature]
+            ))]
+        scores = defaultdict(float)
+        for feature in rare:
+            value = vector[feature]
+            for other, other_value in self.postings[feature]:
+                scores[other] += value * other_value
+        scores.pop(pk, None)
+        candidates = heapq.nlargest(
+            limit * self.rescore, scores, key=scores.__getitem__
+        )
+        return heapq.nlargest(
+            limit,
+            ((other, self.similarity(vector, other)) for other in candidates),
+            key=lambda neighbour: (neighbour[1], neighbour[0])
+        )
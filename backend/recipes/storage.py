@@ -0,0 +1,66 @@
+import hashlib
+import os
+import posixpath
+
+from django.core.files.storage import FileSystemStorage
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Файловое хранилище, в котором имя файла — SHA-256 его содержимого.
+
+    Файл кладется в подкаталог по первым двум символам хеша внутри
+    каталога upload_to. Если файл с таким содержимым уже есть,
+    повторная запись не выполняется и возвращается имя существующего;
+    время изменения файла при этом обновляется, чтобы gc_media не
+    удалил его как старый файл без ссылок до фиксации новой ссылки.
+    """
+
+    def digest(self, content):
+        sha256 = hashlib.sha256()
+        for chunk in content.chunks():
+            sha256.update(chunk)
+        content.seek(0)
+        return sha256.hexdigest()
+
+    def _save(self, name, content):
+        directory, file_name = posixpath.split(name)
+        extension = posixpath.splitext(file_name)[1].lower()
+        digest = self.digest(content)
+        name = posixpath.join(directory, digest[:2], f'{digest}{extension}')
+        if self.exists(name):
+            try:
+                os.utime(self.path(name))
+                return name
+            except FileNotFoundError:
+                pass
+        return super()._save(name, content)
+
+
+def retain(names):
+    """Увеличивает число ссылок на файлы names."""
+    from recipes.models import StoredFile
+
+    if not names:
+        return
+    StoredFile.objects.bulk_create(
+        [StoredFile(name=name) for name in names],
+        ignore_conflicts=True
+    )
+    StoredFile.objects.filter(name__in=names).update(
+        references=F('references') + 1
+    )
+
+
+def release(names):
+    """Уменьшает число ссылок на файлы names."""
+    from recipes.models import StoredFile
+
+    if not names:
+        return
+    StoredFile.objects.filter(name__in=names, references__gt=0).update(
+        references=F('references') - 1
+    )
@@ -0,0 +1,209 @@
+import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+
+from recipes.consts import (
+    TIMELINE_BACKFILL_RECIPES, TIMELINE_FANOUT_BATCH_SIZE,
+    TIMELINE_FANOUT_MAX_SUBSCRIBERS
+)
+
+logger = logging.getLogger(__name__)
+
+executor = (
+    ThreadPoolExecutor(
+        settings.TIMELINE_FANOUT_WORKERS, thread_name_prefix='timeline-fanout'
+    )
+    if settings.TIMELINE_FANOUT_WORKERS > 0 else None
+)
+
+
+def fan_out(recipe_ids, batch_size=TIMELINE_FANOUT_BATCH_SIZE):
+    """
+    Раскладывает рецепты в ленты подписчиков их авторов пакетами
+    примерно по batch_size записей и отмечает рецепты разосланными.
+
+    Рецепты авторов, у которых больше TIMELINE_FANOUT_MAX_SUBSCRIBERS
+    подписчиков, остаются неразосланными: лента читает их напрямую
+    из таблицы рецептов, как и рецепты, до которых очередь еще
+    не дошла. Возвращает число обработанных записей ленты.
+    """
+    from recipes.models import Recipe, TimelineEntry, User
+
+    recipes = defaultdict(list)
+    for pk, author_id, pub_date in Recipe.objects.filter(
+        pk__in=recipe_ids,
+        fanned_out=False,
+        author__subscribers_count__lte=TIMELINE_FANOUT_MAX_SUBSCRIBERS
+    ).values_list('pk', 'author_id', 'pub_date'):
+        recipes[author_id].append((pk, pub_date))
+    written = 0
+    for author_id, author_recipes in recipes.items():
+        followers = User.subscriptions.through.objects.filter(
+            to_user_id=author_id
+        ).order_by('from_user_id').values_list('from_user_id', flat=True)
+        size = max(batch_size // len(author_recipes), 1)
+        last = 0
+        while True:
+            batch = list(followers.filter(from_user_id__gt=last)[:size])
+            if not batch:
+                break
+            last = batch[-1]
+            written += len(TimelineEntry.objects.bulk_create(
+                (TimelineEntry(
+                    user_id=user_id,
+                    recipe_id=pk,
+                    author_id=author_id,
+                    pub_date=pub_date
+                ) for user_id in batch for pk, pub_date in author_recipes),
+                ignore_conflicts=True
+            ))
+        Recipe.objects.filter(
+            pk__in=[pk for pk, _ in author_recipes]
+        ).update(fanned_out=True)
+    return written
+
+
+def fan_out_pending(batch_size=TIMELINE_FANOUT_BATCH_SIZE):
+    """
+    Рассылает все неразосланные рецепты, например оставшиеся в очереди
+    остановленного процесса. Возвращает число рецептов и записей ленты.
+    """
+    from recipes.models import Recipe
+
+    pending = Recipe.objects.filter(
+        fanned_out=False,
+        author__subscribers_count__lte=TIMELINE_FANOUT_MAX_SUBSCRIBERS
+    ).order_by('pk').values_list('pk', flat=True)
+    recipes = written = 0
+    last = 0
+    while True:
+        recipe_ids = list(pending.filter(pk__gt=last)[:batch_size])
+        if not recipe_ids:
+            return recipes, written
+        last = recipe_ids[-1]
+        recipes += len(recipe_ids)
+        written += fan_out(recipe_ids, batch_size)
+
+
+def fan_out_logged(recipe_ids):
+    """
+    Рассылает рецепты, записывая ошибку в лог: неразосланные рецепты
+    остаются в очереди fan_out_pending и читаются лентой напрямую.
+    """
+    try:
+        fan_out(recipe_ids)
+    except Exception:
+        logger.exception(
+            'Не удалось разослать рецепты %s в ленты подписчиков',
+            recipe_ids
+        )
+
+
+def fan_out_in_pool(recipe_ids):
+    """Задача пула: закрывает соединение с базой своего потока."""
+    try:
+        fan_out_logged(recipe_ids)
+    finally:
+        connection.close()
+
+
+def schedule_fan_out(recipe):
+    """
+    Ставит рассылку рецепта в очередь фонового пула после фиксации
+    транзакции. Без пула рецепт рассылается сразу, а ошибка рассылки
+    не попадает в ответ: рецепт уже сохранен.
+    """
+    recipe_ids = (recipe.pk,)
+    if executor is None:
+        transaction.on_commit(lambda: fan_out_logged(recipe_ids))
+        return
+    transaction.on_commit(
+        lambda: executor.submit(fan_out_in_pool, recipe_ids)
+    )
+
+
+def backfill(pairs):
+    """
+    Добавляет в ленты новых подписчиков последние рецепты авторов.
+    pairs — пары (id подписчика, id автора).
+    """
+    from recipes.models import Recipe, TimelineEntry
+
+    followers = defaultdict(list)
+    for user_id, author_id in pairs:
+        followers[author_id].append(user_id)
+    TimelineEntry.objects.bulk_create(
+        (TimelineEntry(
+            user_id=user_id,
+            recipe_id=pk,
+            author_id=author_id,
+            pub_date=pub_date
+        ) for pk, author_id, pub_date in Recipe.objects.latest_by_authors(
+            followers, TIMELINE_BACKFILL_RECIPES
+        ).filter(
+            author__subscribers_count__lte=TIMELINE_FANOUT_MAX_SUBSCRIBERS
+        ).values_list('pk', 'author_id', 'pub_date')
+            for user_id in followers[author_id]),
+        ignore_conflicts=True
+    )
+
+
+def forget(pairs):
+    """
+    Убирает рецепты авторов из лент отписавшихся пользователей.
+    pairs — пары (id подписчика, id автора).
+    """
+    from recipes.models import TimelineEntry
+
+    authors = defaultdict(list)
+    for user_id, author_id in pairs:
+        authors[user_id].append(author_id)
+    if authors:
+        TimelineEntry.objects.filter(reduce(or_, (
+            Q(user_id=user_id, author_id__in=author_ids)
+            for user_id, author_ids in authors.items()
+        ))).delete()
+
+
+def feed_sources(user):
+    """
+    Возвращает источники ленты подписок пользователя: записи его
+    ленты и рецепты авторов, на которых он подписан, которые
+    читаются напрямую, с полями (дата публикации, id рецепта)
+    каждого источника.
+
+    Напрямую читаются неразосланные рецепты и все рецепты авторов
+    с числом подписчиков больше TIMELINE_FANOUT_MAX_SUBSCRIBERS:
+    при подписке на таких авторов лента не дополняется, а рецепты,
+    разосланные до превышения порога, есть только в лентах прежних
+    подписчиков.
+    Повторы записей ленты и рецептов пагинатор отбрасывает.
+    """
+    from recipes.models import Recipe, TimelineEntry, User
+
+    authors = User.subscriptions.through.objects.filter(
+        from_user=user
+    ).values('to_user_id')
+    return (
+        (
+            TimelineEntry.objects.filter(user=user, author_id__in=authors),
+            ('pub_date', 'recipe_id')
+        ),
+        (
+            Recipe.objects.filter(
+                Q(fanned_out=False) | Q(
+                    author__subscribers_count__gt=(
+                        TIMELINE_FANOUT_MAX_SUBSCRIBERS
+                    )
+                ),
+                author_id__in=authors
+            ),
+            ('pub_date', 'id')
+        ),
+    )